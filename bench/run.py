@@ -0,0 +1,330 @@
+# Load test for the harpoon server itself. Starts harpoon.py against the stub
+# hou module and fake Gaea CLI in bench/stubs, drives every route with
+# concurrent clients and writes throughput, latency percentiles and peak
+# memory to a JSON file.
+#
+#   python bench/run.py --concurrency 8 --requests 200 --output before.json
+#   python bench/run.py --output after.json --baseline before.json
+#
+# The fake Gaea CLI is launched through a shell wrapper, so TOR scenarios need
+# a POSIX system.
+import os
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import socket
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+STUBS_DIR = os.path.join(BENCH_DIR, "stubs")
+
+HDA_NAME = "bench.hda"
+HIP_NAME = "bench.hip"
+TOR_NAME = "bench.tor"
+
+
+class Client:
+
+    def __init__(self, baseUrl, timeout=600):
+        self.baseUrl = baseUrl
+        self.timeout = timeout
+
+    def request(self, method, path, form=None):
+        data = urllib.parse.urlencode(form).encode() if form is not None else None
+        request = urllib.request.Request(self.baseUrl + path, data=data, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def get(self, path):
+        return self.request("GET", path)
+
+    def post(self, path, form):
+        return self.request("POST", path, form)
+
+
+def check(status, body, expected=200):
+    if status != expected:
+        raise RuntimeError("HTTP {}: {}".format(status, body[:200]))
+    return body
+
+
+def cookForm(rng) -> dict:
+    # Random values keep the result cache, if enabled, from answering
+    return {
+        "size": json.dumps([rng.randint(1, 10)]),
+        "scale": json.dumps([rng.random(), rng.random()]),
+        "label": json.dumps(str(rng.random()))
+    }
+
+
+def torForm(rng) -> dict:
+    return {
+        "seed": json.dumps([rng.randint(0, 100)]),
+        "height": json.dumps([rng.random()])
+    }
+
+
+def runJob(client, rng):
+    status, body = client.post("/api/jobs/hdaprocessor/{}".format(HDA_NAME), cookForm(rng))
+    job = json.loads(check(status, body, 202))
+    # the event stream ends once the job has finished
+    check(*client.get("/api/jobs/{}/events".format(job["id"])))
+    check(*client.get("/api/jobs/{}/result".format(job["id"])))
+    check(*client.request("DELETE", "/api/jobs/{}".format(job["id"])))
+
+
+SCENARIOS = {
+    "hdalibrary": lambda client, rng: check(*client.get("/api/hdalibrary")),
+    "hdaschema": lambda client, rng: check(*client.get("/api/hdaprocessor/{}".format(HDA_NAME))),
+    "hdaprocessor": lambda client, rng: check(*client.post("/api/hdaprocessor/{}".format(HDA_NAME), cookForm(rng))),
+    "hdabatch": lambda client, rng: check(*client.post("/api/hdaprocessor/{}/batch".format(HDA_NAME), {
+        "variants": json.dumps([{"size": [rng.randint(1, 10)]} for _ in range(4)])
+    })),
+    "hiplibrary": lambda client, rng: check(*client.get("/api/hiplibrary")),
+    "hipprocessor": lambda client, rng: check(*client.get("/api/hipprocessor/{}".format(HIP_NAME))),
+    "torlibrary": lambda client, rng: check(*client.get("/api/torlibrary")),
+    "torschema": lambda client, rng: check(*client.get("/api/torprocessor/{}".format(TOR_NAME))),
+    "torprocessor": lambda client, rng: check(*client.post("/api/torprocessor/{}".format(TOR_NAME), torForm(rng))),
+    "jobs": runJob,
+    "joblist": lambda client, rng: check(*client.get("/api/jobs")),
+    "cachestats": lambda client, rng: check(*client.get("/api/cachestats")),
+    "timings": lambda client, rng: check(*client.get("/api/timings")),
+    "metrics": lambda client, rng: check(*client.get("/metrics"))
+}
+
+
+def createLibraries(root, args):
+    os.makedirs(os.path.join(root, "HDALibrary"))
+    os.makedirs(os.path.join(root, "HIPLibrary"))
+    os.makedirs(os.path.join(root, "TORLibrary"))
+    parms = [
+        {"name": "size", "type": "Int", "default": [5], "min": 1, "max": 10, "minIsStrict": True},
+        {"name": "scale", "type": "Float", "default": [1.0, 1.0]},
+        {"name": "label", "type": "String", "default": [""]},
+        {"name": "details", "type": "Folder", "parms": [
+            {"name": "detail{}".format(index), "type": "Float", "default": [0.5]} for index in range(args.parms)
+        ]}
+    ]
+    with open(os.path.join(root, "HDALibrary", HDA_NAME), "w") as fp:
+        json.dump({"name": "bench", "category": "Top", "cookDelay": args.cook_delay, "outputSize": args.output_size,
+                   "parms": parms}, fp)
+    with open(os.path.join(root, "HIPLibrary", HIP_NAME), "w") as fp:
+        fp.write("bench")
+    with open(os.path.join(root, "TORLibrary", TOR_NAME), "w") as fp:
+        fp.write("bench")
+    binDir = os.path.join(root, "bin")
+    os.makedirs(binDir)
+    gaea = os.path.join(binDir, "gaea.build.exe")
+    with open(gaea, "w") as fp:
+        fp.write('#!/bin/sh\nexec "{}" "{}" "$@"\n'.format(sys.executable, os.path.join(STUBS_DIR, "gaea.py")))
+    os.chmod(gaea, 0o755)
+    return binDir
+
+
+def freePort() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def startServer(root, binDir, port, args) -> subprocess.Popen:
+    env = dict(os.environ)
+    env["PATH"] = binDir + os.pathsep + env.get("PATH", "")
+    # worker processes import lib.workerpool and hou as well
+    env["PYTHONPATH"] = os.pathsep.join([STUBS_DIR, REPO_DIR] + [path for path in [env.get("PYTHONPATH")] if path])
+    env["GAEA_STUB_DELAY"] = str(args.gaea_delay)
+    env["GAEA_STUB_OUTPUT_SIZE"] = str(args.gaea_output_size)
+    command = [sys.executable, os.path.join(REPO_DIR, "harpoon.py"), "-p", str(port)] + args.server_args.split()
+    with open(os.path.join(root, "server.log"), "w") as log:
+        server = subprocess.Popen(command, cwd=root, env=env, stdout=log, stderr=subprocess.STDOUT)
+    client = Client("http://127.0.0.1:{}".format(port), timeout=5)
+    deadline = time.time() + args.startup_timeout
+    while time.time() < deadline:
+        if server.poll() is not None:
+            break
+        try:
+            client.get("/api/hdalibrary")
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    with open(os.path.join(root, "server.log")) as fp:
+        raise RuntimeError("harpoon did not start:\n" + fp.read())
+
+
+def peakRss(pid):
+    # Peak resident set size in bytes, where the platform reports it
+    try:
+        with open("/proc/{}/status".format(pid)) as fp:
+            for line in fp:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process(pid).memory_info()
+        return getattr(info, "peak_wset", info.rss)
+    except Exception:
+        return None
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    # nearest rank
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def runScenario(name, client, args) -> dict:
+    scenario = SCENARIOS[name]
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def one(index):
+        # one generator per request so runs do not depend on thread timing
+        rng = random.Random("{}:{}:{}".format(args.seed, name, index))
+        start = time.perf_counter()
+        try:
+            scenario(client, rng)
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+            return
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+
+    for index in range(args.warmup):
+        one(-1 - index)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(one, range(args.requests)))
+    duration = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": args.requests,
+        "errors": len(errors),
+        "firstError": errors[0] if errors else None,
+        "duration": duration,
+        "throughput": len(latencies) / duration if duration > 0 else None,
+        "mean": sum(latencies) / len(latencies) if latencies else None,
+        "p50": percentile(latencies, 0.50),
+        "p90": percentile(latencies, 0.90),
+        "p99": percentile(latencies, 0.99),
+        "max": latencies[-1] if latencies else None
+    }
+
+
+def gitRevision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, stderr=subprocess.DEVNULL,
+                                       universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def formatMs(value) -> str:
+    return "-" if value is None else "{:.1f}".format(value * 1000)
+
+
+def printReport(results, baseline=None):
+    print("{:<14}{:>8}{:>7}{:>10}{:>10}{:>10}{:>10}".format("scenario", "req/s", "errors", "p50 ms", "p99 ms",
+                                                             "max ms", "vs base"))
+    for name, result in results["scenarios"].items():
+        change = ""
+        previous = (baseline or {}).get("scenarios", {}).get(name)
+        if previous and previous.get("throughput") and result.get("throughput"):
+            change = "{:+.1f}%".format((result["throughput"] / previous["throughput"] - 1) * 100)
+        print("{:<14}{:>8.1f}{:>7}{:>10}{:>10}{:>10}{:>10}".format(name, result["throughput"] or 0, result["errors"],
+                                                                   formatMs(result["p50"]), formatMs(result["p99"]),
+                                                                   formatMs(result["max"]), change))
+    rss = results["peakRss"]
+    print("peak RSS: server {} MB".format("-" if rss is None else "{:.1f}".format(rss / 1024 / 1024)))
+
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(description="Benchmark harpoon against stub hou and Gaea backends")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="comma separated scenarios to run (default: all)")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent clients")
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario")
+    parser.add_argument("--warmup", type=int, default=2, help="sequential requests before each scenario")
+    parser.add_argument("--seed", default="harpoon", help="seed for the generated parameter values")
+    parser.add_argument("--cook-delay", type=float, default=0.05, help="seconds each stub HDA cook takes")
+    parser.add_argument("--output-size", type=int, default=64 * 1024, help="bytes written by each stub HDA cook")
+    parser.add_argument("--parms", type=int, default=50, help="extra parms in the stub HDA's folder")
+    parser.add_argument("--gaea-delay", type=float, default=0.05, help="seconds each fake Gaea build takes")
+    parser.add_argument("--gaea-output-size", type=int, default=256 * 1024,
+                        help="bytes written per fake Gaea output")
+    parser.add_argument("--server-args", default="", help="extra harpoon.py options, e.g. \"-w 4 --resultcache=100\"")
+    parser.add_argument("--startup-timeout", type=float, default=60, help="seconds to wait for the server")
+    parser.add_argument("--output", default="bench-results.json", help="JSON file the results are written to")
+    parser.add_argument("--baseline", help="earlier results file to compare throughput against")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary server directory")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parseArgs(argv)
+    names = [name for name in args.scenarios.split(",") if name]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        sys.exit("Unknown scenarios: {}".format(", ".join(unknown)))
+
+    root = tempfile.mkdtemp(prefix="harpoon-bench-")
+    binDir = createLibraries(root, args)
+    port = freePort()
+    server = startServer(root, binDir, port, args)
+    try:
+        client = Client("http://127.0.0.1:{}".format(port))
+        results = {
+            "started": time.time(),
+            "revision": gitRevision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "keep")},
+            "scenarios": {}
+        }
+        for name in names:
+            print("running {}...".format(name), file=sys.stderr)
+            results["scenarios"][name] = runScenario(name, client, args)
+        results["peakRss"] = peakRss(server.pid)
+    finally:
+        server.terminate()
+        try:
+            server.wait(10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    with open(args.output, "w") as fp:
+        json.dump(results, fp, indent=2)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+    printReport(results, baseline)
+    return 1 if any(result["errors"] for result in results["scenarios"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,37 @@
+# Fake Gaea build CLI. "<project> --nodemap" writes a fixed nodemap next to the
+# project, any other call sleeps for GAEA_STUB_DELAY seconds and writes
+# GAEA_STUB_OUTPUT_SIZE bytes to every "name:path.exr" output argument.
+# GAEA_STUB_EXIT sets the exit code.
+import os
+import sys
+import time
+
+NODEMAP = ('<NodeMap>'
+           '<Parameter Variable="seed" Owner="Mountain" Name="Seed" Type="int" Default="1" Min="0" Max="100"/>'
+           '<Parameter Variable="height" Owner="Mountain" Name="Height" Type="double" Default="0.5" Min="0" Max="1"/>'
+           '<Parameter Variable="erosion" Owner="Erosion" Name="Enabled" Type="bool" Default="true"/>'
+           '<Parameter Variable="heightmap" Owner="Output" Name="Out" Type="out" Default=""/>'
+           '<Parameter Variable="mask" Owner="Output" Name="Mask" Type="out" Default=""/>'
+           '</NodeMap>')
+
+
+def main(args):
+    project = args[0]
+    if "--nodemap" in args:
+        with open(os.path.splitext(project)[0] + ".xml", "w") as fp:
+            fp.write(NODEMAP)
+        return 0
+    time.sleep(float(os.environ.get("GAEA_STUB_DELAY", "0.05")))
+    size = int(os.environ.get("GAEA_STUB_OUTPUT_SIZE", "200000"))
+    for arg in args[1:]:
+        name, _, value = arg.partition(":")
+        if value.endswith(".exr"):
+            # partly random so that compression has some work to do
+            with open(value, "wb") as fp:
+                fp.write(os.urandom(size // 4) + b"\0" * (size - size // 4))
+    print("built", project)
+    return int(os.environ.get("GAEA_STUB_EXIT", "0"))
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,272 @@
+# Minimal stand-in for Houdini's hou module, enough to run harpoon without a
+# Houdini license. HDA "libraries" are JSON files:
+#   {"name": "terrain", "cookDelay": 0.5, "outputSize": 4096,
+#    "parms": [{"name": "size", "type": "Int", "default": [5], "min": 1, "max": 10}]}
+# A cook sleeps for the sum of cookDelay over the cooked HDAs and writes a zip
+# holding outputSize bytes to every filecompress output. cookOutput is written
+# straight to file descriptor 1 during the cook, as native Houdini code does.
+import os
+import json
+import time
+import zipfile
+import enum
+
+
+class parmTemplateType(enum.Enum):
+    Int = 0
+    Float = 1
+    String = 2
+    Toggle = 3
+    Menu = 4
+    Button = 5
+    FolderSet = 6
+    Folder = 7
+    Separator = 8
+    Label = 9
+    Ramp = 10
+    Data = 11
+
+
+class parmData(enum.Enum):
+    Int = 0
+    Float = 1
+    String = 2
+    Ramp = 3
+
+
+class parmLook(enum.Enum):
+    Regular = 0
+
+
+class stringParmType(enum.Enum):
+    Regular = 0
+    FileReference = 1
+
+
+class fileType(enum.Enum):
+    Any = 0
+    Image = 1
+
+
+class folderType(enum.Enum):
+    Tabs = 0
+    Simple = 1
+    MultiparmBlock = 2
+
+
+class rampParmType(enum.Enum):
+    Color = 0
+    Float = 1
+
+
+class ParmTemplate:
+    def __init__(self, spec):
+        self.spec = spec
+
+    def name(self): return self.spec["name"]
+    def label(self): return self.spec.get("label", self.spec["name"])
+    def type(self): return parmTemplateType[self.spec.get("type", "Float")]
+    def dataType(self):
+        return {"Int": parmData.Int, "Toggle": parmData.Int, "Menu": parmData.Int,
+                "String": parmData.String, "Ramp": parmData.Ramp}.get(self.spec.get("type", "Float"), parmData.Float)
+    def numComponents(self): return len(self.defaultValue()) if isinstance(self.defaultValue(), (list, tuple)) else 1
+    def look(self): return parmLook.Regular
+    def help(self): return ""
+    def isHidden(self): return False
+    def isLabelHidden(self): return False
+    def joinsWithNext(self): return False
+    def tags(self): return self.spec.get("tags", {})
+    def defaultValue(self):
+        d = self.spec.get("default", (0,))
+        return tuple(d) if isinstance(d, list) else d
+    def minValue(self): return self.spec.get("min", 0)
+    def maxValue(self): return self.spec.get("max", 10)
+    def minIsStrict(self): return self.spec.get("minIsStrict", False)
+    def maxIsStrict(self): return self.spec.get("maxIsStrict", False)
+    def menuItems(self): return tuple(self.spec.get("menuItems", ()))
+    def menuLabels(self): return tuple(self.spec.get("menuLabels", ()))
+    def stringType(self): return stringParmType.Regular
+    def fileType(self): return fileType.Any
+    def defaultValueAsString(self): return ""
+    def menuType(self): return "menuType.Normal"
+    def isMenu(self): return True
+    def isButtonStrip(self): return False
+    def isIconStrip(self): return False
+    def folderType(self): return folderType.Tabs
+    def folderStyle(self): return "Tabs"
+    def defaultExpandedState(self): return False
+    def parmTemplates(self): return tuple(ParmTemplate(p) for p in self.spec.get("parms", []))
+    def rampParmType(self): return rampParmType.Float
+    def defaultBasis(self): return "Linear"
+    def showsControls(self): return True
+    def isActualFolder(self): return True
+    def endsTabGroup(self): return False
+    def folderNames(self): return tuple(self.spec.get("folderNames", ()))
+    def columnLabels(self): return tuple(self.spec.get("columnLabels", ()))
+
+
+class ParmTemplateGroup:
+    def __init__(self, parms):
+        self.parms = parms
+
+    def name(self): return ""
+    def label(self): return ""
+    def entries(self): return tuple(ParmTemplate(p) for p in self.parms)
+
+
+class _Named:
+    def __init__(self, name): self._name = name
+    def name(self): return self._name
+
+
+class NodeType:
+    def __init__(self, name): self._name = name
+    def name(self): return self._name
+    def description(self): return self._name
+    def sourcePath(self): return ""
+    def sourceNetwork(self): return None
+
+
+_installed = {}
+
+
+class HDADefinition:
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        with open(path) as fp:
+            self.data = json.load(fp)
+
+    def isInstalled(self): return self.path in _installed
+    def nodeTypeCategory(self): return _Named(self.data.get("category", "Top"))
+    def nodeTypeName(self): return self.data["name"]
+    def nodeType(self): return NodeType(self.data["name"])
+    def libraryFilePath(self): return self.path
+    def version(self): return "1"
+    def comment(self): return ""
+    def description(self): return self.data.get("description", self.data["name"])
+    def icon(self): return ""
+    def modificationTime(self): return int(os.path.getmtime(self.path))
+    def embeddedHelp(self): return ""
+    def userInfo(self): return ""
+    def extraInfo(self): return ""
+    def minNumInputs(self): return 0
+    def maxNumInputs(self): return 0
+    def maxNumOutputs(self): return 1
+    def parmTemplateGroup(self): return ParmTemplateGroup(self.data.get("parms", []))
+
+
+class _HDA:
+    def definitionsInFile(self, path):
+        return [HDADefinition(path)]
+
+    def installFile(self, path):
+        d = HDADefinition(path)
+        _installed[d.path] = d
+        _types[d.nodeTypeName()] = d
+
+    def reloadFile(self, path):
+        self.installFile(path)
+
+    def uninstallFile(self, path):
+        _installed.pop(os.path.abspath(path), None)
+
+
+hda = _HDA()
+_types = {}
+
+
+class Parm:
+    def __init__(self, node, name):
+        self.node = node
+        self._name = name
+    def name(self): return self._name
+    def set(self, value): self.node.values[self._name] = value
+    def eval(self): return self.node.values.get(self._name)
+    def revertToDefaults(self): self.node.values.pop(self._name, None)
+
+
+class Node:
+    def __init__(self, path, typeName, parent=None):
+        self._path = path
+        self.typeName = typeName
+        self.parent = parent
+        self.children = []
+        self.values = {}
+        self.inputs = []
+
+    def path(self): return self._path
+    def name(self): return self._path.rsplit("/", 1)[-1]
+    def createNode(self, typeName, name=None):
+        node = Node("{}/{}{}".format(self._path, name or typeName, len(self.children)), typeName, self)
+        self.children.append(node)
+        return node
+    def setFirstInput(self, node): self.setInput(0, node)
+    def setInput(self, index, node):
+        while len(self.inputs) <= index:
+            self.inputs.append(None)
+        self.inputs[index] = node
+    def parm(self, name): return Parm(self, name)
+    def parmTuple(self, name): return Parm(self, name)
+    def parms(self):
+        d = _types.get(self.typeName)
+        names = [p["name"] for p in d.data.get("parms", [])] if d else []
+        return [Parm(self, n) for n in names]
+    def setParms(self, parms):
+        self.values.update(parms)
+    def destroy(self):
+        if self.parent:
+            self.parent.children.remove(self)
+    def dirtyWorkItems(self, remove): pass
+    def dirtyAllWorkItems(self, remove): pass
+    def cookWorkItems(self, block=True, tops_only=False):
+        time.sleep(float(os.environ.get("HOU_STUB_COOK_DELAY", "0")))
+    def upstream(self):
+        result = []
+        for node in self.inputs:
+            if node is not None:
+                result.extend(node.upstream())
+                result.append(node)
+        return result
+    def executeGraph(self, filter_static=False, block=True, generate_only=False, tops_only=False):
+        delay = 0.0
+        size = 0
+        for node in self.upstream():
+            d = _types.get(node.typeName)
+            if d is not None:
+                delay += d.data.get("cookDelay", 0)
+                size += d.data.get("outputSize", 1024)
+                if "cookOutput" in d.data:
+                    os.write(1, d.data["cookOutput"].encode())
+        targets = [self] if self.typeName == "filecompress" else [n for n in self.upstream() if n.typeName == "filecompress"]
+        if self.typeName == "merge":
+            delay = max([0] + [_types[n.typeName].data.get("cookDelay", 0) for n in self.upstream() if n.typeName in _types])
+        time.sleep(delay)
+        for t in targets:
+            out = t.values.get("output_filename")
+            os.makedirs(os.path.dirname(out), exist_ok=True)
+            with zipfile.ZipFile(out, "w") as zf:
+                zf.writestr("output.bin", os.urandom(16) + b"\0" * size)
+
+
+_root = Node("/tasks", "topnet")
+
+
+def node(path):
+    if path == "/tasks":
+        return _root
+    if path == "/tasks/ENTRY":
+        return Node(path, "null")
+    return None
+
+
+class _HipFile:
+    def save(self, path): pass
+    def load(self, path, ignore_load_warnings=False):
+        time.sleep(float(os.environ.get("HOU_STUB_HIP_LOAD_DELAY", "0")))
+
+
+hipFile = _HipFile()
+
+
+class OperationFailed(Exception):
+    pass
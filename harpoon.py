@@ -1,11 +1,20 @@
+import time
+STARTED = time.time()
 import os
 import sys
 import signal
 import getopt
-import hou
 from flask import Flask, request
 from lib import logo
 from lib import api
+from lib import flaskext
+from lib.workerpool import WorkerPool
+from lib.resultcache import ResultCache
+from lib.gaea import GaeaRunner
+from lib import workspace
+from lib import metrics
+from lib import serving
+from lib import lazyimport
 
 app = Flask(__name__)
 app.config['JSON_SORT_KEYS'] = False
@@ -18,6 +27,10 @@ def hdalibrary():
 def hdaprocessor(hda_name):
     return api.hdaprocessor(hda_name, request)
 
+@app.route("/api/hdaprocessor/<hda_name>/batch", methods=['POST'])
+def hdabatch(hda_name):
+    return api.hdabatch(hda_name, request)
+
 @app.route("/api/hiplibrary", methods=['GET'])
 def hiplibrary():
     return api.hiplibrary(request)
@@ -34,24 +47,110 @@ def torlibrary():
 def torprocessor(tor_file):
     return api.torprocessor(tor_file, request)
 
+@app.route("/api/jobs", methods=['GET'])
+def joblist():
+    return api.joblist(request)
+
+@app.route("/api/jobs/<processor>/<asset>", methods=['POST'])
+def jobsubmit(processor, asset):
+    return api.jobsubmit(processor, asset, request)
+
+@app.route("/api/jobs/<job_id>", methods=['GET', 'DELETE'])
+def job(job_id):
+    return api.job(job_id, request)
+
+@app.route("/api/jobs/<job_id>/events", methods=['GET'])
+def jobevents(job_id):
+    return api.jobevents(job_id, request)
+
+@app.route("/api/jobs/<job_id>/result", methods=['GET'])
+def jobresult(job_id):
+    return api.jobresult(job_id, request)
+
+@app.route("/api/cachestats", methods=['GET'])
+def cachestats():
+    return api.cachestats(request)
+
+@app.route("/api/timings", methods=['GET'])
+def timings():
+    return api.timings(request)
+
+@app.route("/metrics", methods=['GET'])
+def metricsendpoint():
+    return api.metricsendpoint(request)
+
+@app.route("/health", methods=['GET'])
+def health():
+    return api.health(request)
+
+@app.route("/ready", methods=['GET'])
+def ready():
+    return api.ready(request)
+
+@app.teardown_request
+def teardown(exception):
+    metrics.release()
+
 def print_help_info():
     print("Usage: hython harpoon.py [-p port (default:80)]")
     print("Options:")
     print("-?,-h    : this help")
     print("-d       : run in debug mode")
     print("-p       : specify server port")
+    print("-w       : cook HDAs in N pre-warmed hython worker processes (0: one per core)")
+    print("--hython : hython executable used for worker processes")
+    print("--workertimeout: restart a worker whose job runs longer than N seconds, 0 for no limit (default: 3600)")
+    print("--dumphip: save the scene to temp/dumps before every HDA cook")
+    print("--resultcache: reuse results of identical cooks, keeping at most N MB in temp/results")
+    print("--nocoalesce: cook identical requests separately instead of sharing one cook in flight")
+    print("--uploadlimit: reject requests uploading more than N MB")
+    print("--gaeajobs: run at most N Gaea builds at once (default: one per core)")
+    print("--gaeatimeout: kill Gaea builds running longer than N seconds")
+    print("--slots: cooks that may run at the same time, others queue by priority and client (default: workers or cores)")
+    print("--queue: cooks allowed to wait for a slot before requests get a 429 (default: 64)")
+    print("--production: serve with waitress instead of the Flask development server")
+    print("--threads: request threads in production mode (default: 16)")
+    print("--backlog: connections allowed to wait for a thread in production mode (default: 64)")
+    print("--draintimeout: seconds to wait for running cooks and jobs on shutdown in production mode (default: 300)")
+    print("--warmstart: bind the port right away and warm up in the background, /ready fails until done")
+    print("--watchinterval: seconds between scans of the asset libraries, 0 scans on every listing (default: 2)")
     # print("-s       : specify static files directory")
 
 
-def on_exit(signal, frame):
+def start_workers(workers, hython, timeout):
+    print("Starting {} hython workers".format(workers))
+    api.workerPool = WorkerPool(workers, [hython, "-m", "lib.workerpool"], timeout=timeout)
+
+
+def shutdown():
     print('Bye!')
+    try:
+        api.saveWarmState()
+    except OSError as e:
+        print("Saving {} failed: {}".format(api.WARM_STATE_FILE, e))
+    if api.workerPool is not None:
+        api.workerPool.shutdown()
+
+
+def on_exit(signal, frame):
+    shutdown()
     sys.exit(0)
 
 
 if __name__ == '__main__':
     port = 80
     debug = False
-    opts, args = getopt.getopt(sys.argv[1:], "hdp:s:", ["port=", "help", "debug", "static"])
+    workers = None
+    hython = sys.executable
+    workerTimeout = 3600.0
+    production = False
+    threads = 16
+    backlog = 64
+    drainTimeout = 300
+    watchInterval = 2.0
+    warmStart = False
+    slots = None
+    opts, args = getopt.getopt(sys.argv[1:], "hdp:s:w:", ["port=", "help", "debug", "static", "workers=", "hython=", "workertimeout=", "dumphip", "resultcache=", "nocoalesce", "uploadlimit=", "gaeajobs=", "gaeatimeout=", "production", "threads=", "backlog=", "draintimeout=", "watchinterval=", "warmstart", "slots=", "queue="])
     for opt, arg in opts:
         if opt in ("-h", "--help", "-?"):
             print_help_info()
@@ -60,5 +159,66 @@ if __name__ == '__main__':
             debug = True
         elif opt in ("-p", "--port"):
             port = int(arg)
-    signal.signal(signal.SIGINT, on_exit)
-    app.run(host = "0.0.0.0", port = port, debug = debug)
+        elif opt in ("-w", "--workers"):
+            workers = int(arg) or os.cpu_count()
+        elif opt == "--hython":
+            hython = arg
+        elif opt == "--workertimeout":
+            workerTimeout = float(arg) or None
+        elif opt == "--dumphip":
+            os.environ["HARPOON_DUMP_HIP"] = "1"
+            api.DUMP_HIP = True
+        elif opt == "--resultcache":
+            api.resultCache = ResultCache("temp/results", int(arg) * 1024 * 1024)
+        elif opt == "--nocoalesce":
+            api.cookFlights = None
+        elif opt == "--uploadlimit":
+            flaskext.UPLOAD_LIMIT = int(arg) * 1024 * 1024
+            app.config['MAX_CONTENT_LENGTH'] = flaskext.UPLOAD_LIMIT
+        elif opt == "--gaeajobs":
+            api.gaeaRunner = GaeaRunner(api.GAEA_CLI, int(arg), api.gaeaRunner.timeout)
+        elif opt == "--gaeatimeout":
+            api.gaeaRunner.timeout = float(arg)
+        elif opt == "--production":
+            production = True
+        elif opt == "--threads":
+            threads = int(arg)
+        elif opt == "--backlog":
+            backlog = int(arg)
+        elif opt == "--draintimeout":
+            drainTimeout = float(arg)
+        elif opt == "--watchinterval":
+            watchInterval = float(arg)
+        elif opt == "--warmstart":
+            warmStart = True
+        elif opt == "--slots":
+            slots = int(arg)
+        elif opt == "--queue":
+            api.scheduler.maxQueued = int(arg)
+    api.startup.started = STARTED
+    if workers is not None:
+        api.jobManager.maxWorkers = workers
+    api.scheduler.slots = slots or workers or api.scheduler.slots
+    workspace.startCollector([workspace.WORKSPACE_ROOT, api.jobManager.directory])
+    steps = [("hou", lambda: lazyimport.load(api.hou))]
+    if workers is not None:
+        steps.append(("workers", lambda: start_workers(workers, hython, workerTimeout)))
+    if warmStart:
+        steps.append(("snapshot", api.warmUp))
+    if watchInterval > 0:
+        steps.append(("watcher", lambda: api.libraryWatcher.start(watchInterval)))
+    if warmStart:
+        # requests are served while warming up, cooking in this process
+        # until the workers are there
+        api.startup.run(steps)
+    else:
+        for name, step in steps:
+            with api.startup.phase(name):
+                step()
+        api.startup.finish()
+    api.startup.mark("bind")
+    if production:
+        serving.serve(app, "0.0.0.0", port, threads, backlog, drainTimeout, api.jobManager, shutdown)
+    else:
+        signal.signal(signal.SIGINT, on_exit)
+        app.run(host = "0.0.0.0", port = port, debug = debug)
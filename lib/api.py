@@ -1,19 +1,72 @@
-import datetime
+from __future__ import annotations
 import os
-import io
-import sys
 import json
 import time
 import shutil
 import hashlib
-import hou
-import zipfile
-from flask import Flask, send_file, jsonify
+import threading
+import mmap
+from lib.lazyimport import hou
+from flask import Response, jsonify
 from xml.etree import ElementTree
 from lib.serializer import *
 from lib import flaskext
+from lib import zipstream
+from lib import metrics
+from lib.catalog import HDACatalog, HDA_EXTENSIONS, fileStat
+from lib.library import LibraryWatcher
+from lib.startup import Startup
+from lib.cache import LRUCache
+from lib import topnets
+from lib.jobs import JobManager, JobQueueFull
+from lib.scheduler import Scheduler, SchedulerFull, SchedulerCancelled, PRIORITIES
+from lib.resultcache import ResultCache
+from lib.singleflight import SingleFlight
+from lib.gaea import GaeaRunner, GaeaError, GaeaTimeout, GaeaCancelled
+from lib.validation import ParmValidator, ValidationError, coerce
 
 GAEA_CLI = "gaea.build.exe"
+HASH_CHUNK_SIZE = 1024 * 1024
+MMAP_THRESHOLD = 16 * 1024 * 1024
+MAX_BATCH_VARIANTS = 256
+DUMP_HIP = os.environ.get("HARPOON_DUMP_HIP") == "1"
+HIP_EXTENSIONS = ['.hip', '.hiplc']
+TOR_EXTENSIONS = ['.tor']
+WARM_STATE_FILE = "temp/warmstate.json"
+# Parm tag holding the value a parm is cooked with in preview mode
+PREVIEW_TAG = "harpoon_preview"
+
+startup = Startup()
+hdaCatalog = HDACatalog("HDALibrary", "temp/hdacatalog.json")
+libraryWatcher = LibraryWatcher({
+    "HDALibrary": HDA_EXTENSIONS,
+    "HIPLibrary": HIP_EXTENSIONS,
+    "TORLibrary": TOR_EXTENSIONS
+})
+hdaDefinitionCache = LRUCache(64)
+parmValidatorCache = LRUCache(64)
+previewParmsCache = LRUCache(64)
+loadedHDAs = {}
+loadedHDAsLock = threading.Lock()
+# hda path -> lock held while that library is installed or reloaded
+loadingHDAs = {}
+workerPool = None
+jobManager = JobManager("temp/jobs")
+scheduler = Scheduler(os.cpu_count() or 1)
+resultCache = None
+# a cancelled or rejected leader leaves its followers to cook themselves
+cookFlights = SingleFlight(unshared=(SchedulerCancelled, SchedulerFull, GaeaCancelled))
+gaeaRunner = GaeaRunner(GAEA_CLI)
+# (path, fileStat) of the hip file loaded into this process' scene
+loadedHip = None
+hipLock = threading.Lock()
+# (client, hda library path) -> the latest preview of that client
+previews = {}
+previewsLock = threading.Lock()
+previewCounts = {"previews": 0, "refinements": 0, "superseded": 0}
+assetDigests = {}
+torNodemaps = {}
+torNodemapsLock = threading.Lock()
 
 def logRequestDebugInfo(request):
     # if .isInDebugMode():
@@ -23,118 +76,680 @@ def logRequestDebugInfo(request):
     print("{} <\033[35m{}\033[0m> [\033[4;34m{}\033[0m]".format(dt, method.upper(), path))
 
 def hdalibrary(request):
-    hdas = os.listdir("HDALibrary")
-    hdaLibrary = {}
-    for hdaFile in hdas:
-        ext = os.path.splitext(hdaFile)[1]
-        if ext not in ['.hda', '.otl', '.hdalc', '.otllc']:
+    libraryWatcher.refresh()
+    return hdaCatalog.response(request)
+
+
+@libraryWatcher.listener("HDALibrary")
+def hdaLibraryChanged(changed, removed):
+    # Install new and changed HDAs before anyone asks for them
+    for hdaFile in removed:
+        hdaPath = os.path.abspath(os.path.join("HDALibrary", hdaFile))
+        with loadedHDAsLock:
+            loadedHDAs.pop(hdaPath, None)
+        hdaDefinitionCache.discard(lambda key: key[0] == hdaPath)
+        parmValidatorCache.discard(lambda key: key[0] == hdaPath)
+        previewParmsCache.discard(lambda key: key[0] == hdaPath)
+    for hdaFile in changed:
+        # one broken file must not keep the others from loading
+        try:
+            loadHDA(os.path.abspath(os.path.join("HDALibrary", hdaFile)))
+        except Exception as e:
+            print("Loading {} failed: {}".format(hdaFile, e))
+    hdaCatalog.refresh()
+
+
+def cachestats(request):
+    return jsonify({
+        "hdaDefinitions": hdaDefinitionCache.stats(),
+        "results": resultCache.stats() if resultCache is not None else None,
+        "coalescing": cookFlights.stats() if cookFlights is not None else None
+    })
+
+
+def timings(request):
+    return jsonify(list(metrics.recentTimings))
+
+
+def metricsendpoint(request):
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+
+def health(request):
+    # Answers as soon as the port is bound, whether or not warm-up is done
+    return jsonify(startup.serialize())
+
+
+def ready(request):
+    if startup.ready.is_set():
+        return jsonify(startup.serialize())
+    response = jsonify(startup.serialize())
+    response.status_code = 503
+    response.headers["Retry-After"] = "5"
+    return response
+
+
+def saveWarmState(path=WARM_STATE_FILE):
+    # Remember which assets this process has loaded, the next start warms
+    # them up before reporting ready
+    with loadedHDAsLock:
+        hdaFiles = [os.path.basename(hdaPath) for hdaPath in loadedHDAs]
+    with torNodemapsLock:
+        torFiles = [os.path.basename(tor_file) for tor_file in torNodemaps]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tempFile = path + ".tmp"
+    with open(tempFile, "w") as fp:
+        json.dump({"hdas": hdaFiles, "tors": torFiles}, fp)
+    os.replace(tempFile, path)
+
+
+def warmUp(path=WARM_STATE_FILE):
+    # Install the HDAs and build the definitions, validators and nodemaps
+    # listed in the snapshot. Assets that are gone or broken are skipped,
+    # requests load them on demand as usual.
+    try:
+        with open(path, "r") as fp:
+            state = json.load(fp)
+    except (OSError, ValueError):
+        return
+    for hdaFile in state.get("hdas", []):
+        hdaPath = os.path.abspath(os.path.join("HDALibrary", hdaFile))
+        if not os.path.exists(hdaPath):
+            continue
+        try:
+            hda = loadHDA(hdaPath)
+            getHDADefinition(hda).toJson()
+            getHDAValidator(hda)
+        except Exception as e:
+            print("Warming up {} failed: {}".format(hdaFile, e))
+    for tor_name in state.get("tors", []):
+        if not os.path.exists(os.path.join("TORLibrary", tor_name)):
             continue
-        hdaPath = os.path.join("HDALibrary", hdaFile)
-        definition = hou.hda.definitionsInFile(hdaPath)[0]
-        if not definition.isInstalled():
+        try:
+            tor_file, templates = loadTOR(tor_name)
+            templates.toJson()
+            get_tor_validator(tor_file, templates)
+        except Exception as e:
+            print("Warming up {} failed: {}".format(tor_name, e))
+
+
+@metrics.registry.collector
+def collectMetrics():
+    jobs = jobManager.stats()
+    gaea = gaeaRunner.stats()
+    schedule = scheduler.stats()
+    caches = [("hdaDefinitions", hdaDefinitionCache.stats()), ("parmValidators", parmValidatorCache.stats())]
+    if resultCache is not None:
+        caches.append(("results", resultCache.stats()))
+    tempSizes = []
+    if os.path.isdir("temp"):
+        for entry in sorted(os.scandir("temp"), key=lambda entry: entry.name):
+            if entry.is_dir():
+                tempSizes.append(((("dir", entry.name),), metrics.directorySize(entry.path)))
+    collected = [
+        ("harpoon_job_queue_depth", "gauge", "Jobs waiting to run", [((), jobs["queueDepth"])]),
+        ("harpoon_jobs_running", "gauge", "Jobs being processed", [((), jobs["running"])]),
+        ("harpoon_job_workers", "gauge", "Jobs that may run at the same time", [((), jobs["maxWorkers"])]),
+        ("harpoon_gaea_builds_running", "gauge", "Gaea builds in progress", [((), gaea["running"])]),
+        ("harpoon_gaea_builds_waiting", "gauge", "Gaea builds waiting for a slot", [((), gaea["waiting"])]),
+        ("harpoon_gaea_builds_total", "counter", "Finished Gaea builds by outcome",
+         [((("result", result),), gaea[result]) for result in ("completed", "failed", "timeouts", "cancelled")]),
+        ("harpoon_cache_entries", "gauge", "Entries held by each cache",
+         [((("cache", name),), stats["size"]) for name, stats in caches]),
+        ("harpoon_cache_hits_total", "counter", "Cache lookups that found an entry",
+         [((("cache", name),), stats["hits"]) for name, stats in caches]),
+        ("harpoon_cache_misses_total", "counter", "Cache lookups that found nothing",
+         [((("cache", name),), stats["misses"]) for name, stats in caches]),
+        ("harpoon_cache_hit_ratio", "gauge", "Share of cache lookups that found an entry",
+         [((("cache", name),), stats["hitRate"]) for name, stats in caches]),
+        ("harpoon_temp_bytes", "gauge", "Disk space used under temp/", tempSizes),
+        ("harpoon_scheduler_slots", "gauge", "Cooks that may run at the same time", [((), schedule["slots"])]),
+        ("harpoon_scheduler_running", "gauge", "Cooks holding a slot", [((), schedule["running"])]),
+        ("harpoon_scheduler_queued", "gauge", "Cooks waiting for a slot",
+         [((("priority", priority),), queued) for priority, queued in schedule["queued"].items()]),
+        ("harpoon_scheduler_clients", "gauge", "Clients with cooks waiting for a slot",
+         [((("priority", priority),), clients) for priority, clients in schedule["clients"].items()]),
+        ("harpoon_scheduler_admitted_total", "counter", "Cooks given or queued for a slot",
+         [((("priority", priority),), admitted) for priority, admitted in schedule["admitted"].items()]),
+        ("harpoon_scheduler_rejected_total", "counter", "Cooks turned away with a 429",
+         [((("priority", priority),), rejected) for priority, rejected in schedule["rejected"].items()]),
+        ("harpoon_previews_total", "counter", "Preview cooks, the refinements they queued and previews superseded "
+                                              "by a newer one",
+         [((("kind", kind),), count) for kind, count in previewCounts.items()]),
+        ("harpoon_ready", "gauge", "1 once warm-up finished", [((), int(startup.ready.is_set()))]),
+        ("harpoon_startup_seconds", "gauge", "Seconds each startup phase took",
+         [((("phase", name),), seconds) for name, seconds in startup.phases]),
+        ("harpoon_library_files", "gauge", "Assets in each library as last scanned",
+         [((("library", directory),), len(library.files)) for directory, library in libraryWatcher.libraries.items()])
+    ]
+    if resultCache is not None:
+        collected.append(("harpoon_result_cache_bytes", "gauge", "Bytes held by the result cache",
+                          [((), resultCache.totalBytes)]))
+    if cookFlights is not None:
+        flights = cookFlights.stats()
+        collected.append(("harpoon_cooks_in_flight", "gauge", "Distinct cooks running that identical requests can join",
+                          [((), flights["inFlight"])]))
+        collected.append(("harpoon_cooks_coalesced_waiting", "gauge", "Requests waiting on an identical cook in flight",
+                          [((), flights["waiting"])]))
+        collected.append(("harpoon_cooks_coalesced_total", "counter", "Cooks saved by sharing an identical one in flight",
+                          [((), flights["saved"])]))
+    if workerPool is not None:
+        pool = workerPool.stats()
+        collected.append(("harpoon_worker_pool_size", "gauge", "hython worker processes", [((), pool["size"])]))
+        collected.append(("harpoon_worker_pool_busy", "gauge", "hython workers cooking", [((), pool["busy"])]))
+        collected.append(("harpoon_worker_affinity_total", "counter", "Hip jobs by whether a worker had the scene loaded",
+                          [((("result", "hit"),), pool["affinityHits"]), ((("result", "miss"),), pool["affinityMisses"])]))
+    return collected
+
+
+def schedulingClass(request, default="interactive"):
+    # Clients pick a lower priority with X-Harpoon-Priority or ?priority=,
+    # fair sharing is per X-Harpoon-Client or else per address
+    priority = request.headers.get("X-Harpoon-Priority") or request.args.get("priority") or default
+    if priority not in PRIORITIES:
+        priority = default
+    return priority, request.headers.get("X-Harpoon-Client") or request.remote_addr
+
+
+def scheduled(cook, priority, client, admit=True, cancelEvent=None):
+    # Wrap cook so that it first waits for a scheduler slot
+    def run():
+        start = time.time()
+        with metrics.span("queue"):
+            scheduler.acquire(priority, client, admit, cancelEvent)
+        metrics.queueSeconds.observe(time.time() - start, priority)
+        start = time.time()
+        try:
+            return cook()
+        finally:
+            scheduler.release(time.time() - start)
+    return run
+
+
+def schedulerFull(error: SchedulerFull):
+    return jsonify({"error": str(error)}), 429, {"Retry-After": str(error.retryAfter)}
+
+
+def sendTimed(request, response, stage="send"):
+    # Report the stages so far to the client and time the rest of the
+    # response, the timer finishes when the temp files are removed
+    timer = getattr(request, "timer", None)
+    if timer is not None:
+        response.headers["Server-Timing"] = timer.serverTiming()
+        timer.begin(stage)
+    return response
+
+
+def loadHDA(hdaPath):
+    # Install or reload the library only when its size or mtime changed
+    # since the last time this process loaded it.
+    stat = fileStat(hdaPath)
+    with loadedHDAsLock:
+        loaded = loadedHDAs.get(hdaPath)
+        if loaded is not None and loaded[0] == stat:
+            return loaded[1]
+        loading = loadingHDAs.setdefault(hdaPath, threading.Lock())
+    # a reload waits for running cooks of the type, loads of other
+    # libraries go on meanwhile
+    with loading:
+        with loadedHDAsLock:
+            loaded = loadedHDAs.get(hdaPath)
+        if loaded is not None and loaded[0] == stat:
+            return loaded[1]
+        hda = hou.hda.definitionsInFile(hdaPath)[0]
+        if not hda.isInstalled():
             hou.hda.installFile(hdaPath)
-        nodeType = definition.nodeTypeCategory().name()
-        if nodeType not in hdaLibrary:
-            hdaLibrary[nodeType] = {}
-        hdaLibrary[nodeType][hdaFile] = definition.description()
-    return jsonify(hdaLibrary)
+        else:
+            topnets.reloadDefinition(hda.nodeTypeName(), lambda: hou.hda.reloadFile(hdaPath))
+        with loadedHDAsLock:
+            loadedHDAs[hdaPath] = (stat, hda)
+    hdaDefinitionCache.discard(lambda key: key[0] == hda.libraryFilePath())
+    parmValidatorCache.discard(lambda key: key[0] == hda.libraryFilePath())
+    previewParmsCache.discard(lambda key: key[0] == hda.libraryFilePath())
+    return hda
 
 
 def hdaprocessor(hda_name, request):
     hdaPath = os.path.abspath(os.path.join("HDALibrary", hda_name))
-    hda = hou.hda.definitionsInFile(hdaPath)[0]
-    if not hda.isInstalled():
-        hou.hda.installFile(hdaPath)
-    else:
-        hou.hda.reloadFile(hdaPath)
+    if request.method == 'POST':
+        request.timer = metrics.RequestTimer("hdaprocessor", hda_name)
+    with metrics.span("reload"):
+        hda = loadHDA(hdaPath)
 
+    if request.method == 'POST' and request.args.get("preview", "0").lower() in ("1", "true"):
+        return hdapreview(hda, request)
     if request.method == 'POST':
         return hdaprocessor_post(hda, request)
     else:
         return hdaprocessor_get(hda, request)
 
+def hdaDefinitionKey(hda):
+    return (hda.libraryFilePath(), tuple(fileStat(hda.libraryFilePath())), hda.modificationTime())
+
+def getHDADefinition(hda) -> HDADefinition:
+    key = hdaDefinitionKey(hda)
+    definition = hdaDefinitionCache.get(key)
+    if definition is None:
+        definition = HDADefinition(hda)
+        hdaDefinitionCache.put(key, definition)
+    return definition
+
+def getHDAValidator(hda) -> ParmValidator:
+    key = hdaDefinitionKey(hda)
+    validator = parmValidatorCache.get(key)
+    if validator is None:
+        validator = ParmValidator(getHDADefinition(hda).parmTemplateGroup)
+        parmValidatorCache.put(key, validator)
+    return validator
+
 def hdaprocessor_get(hda, request):
-    return jsonify(HDADefinition(hda).serialize())
+    definition = getHDADefinition(hda)
+    try:
+        query = parseParmTemplateQuery(request.args)
+        if query is None:
+            return Response(definition.toJson(), mimetype="application/json")
+        table = dict(definition.serialize())
+        table["parmTemplateGroup"] = definition.parmTemplateGroup.view(**query)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 404
+    return jsonify(table)
 
 def hdaprocessor_post(hda, request):
-    HARPOON_ROOT = os.path.abspath(".")
-    hou.hipFile.save("temp/project_dump.hiplc")
-    nodeTypeName = hda.nodeTypeName()
-    topnet = hou.node("/tasks").createNode("topnet")
-    topNode = topnet.createNode(nodeTypeName)
+    try:
+        uploadFiles = request.createTempFiles()
+        with metrics.span("validate"):
+            parms = getHDAValidator(hda).validate(request.form, uploadFiles)
+        outputFile = request.getWorkspace().file("output.zip")
+        cached_result("hda", hda.libraryFilePath(), request.form, uploadFiles, outputFile,
+                      scheduled(lambda: runHDA(hda, parms, outputFile), *schedulingClass(request)),
+                      request.uploadHashes())
+    except ValidationError as e:
+        request.removeTempFiles()
+        return jsonify(e.serialize()), 400
+    except SchedulerFull as e:
+        request.removeTempFiles()
+        return schedulerFull(e)
+    except Exception:
+        request.removeTempFiles()
+        raise
+    return sendTimed(request, flaskext.sendFile(request, outputFile, "response.zip", "application/zip",
+                                                request.removeTempFiles))
+
+
+def hdapreview(hda, request):
+    # Cooks with the values the HDA declares for previews through the
+    # harpoon_preview parm tag. &refine=1 also queues the full quality cook as
+    # a job, its id is sent in X-Harpoon-Job. A newer preview of the same HDA
+    # from the same client cancels this one while it waits for a slot, and
+    # its refinement job.
+    priority, client = schedulingClass(request)
+    previewKey = (client, hda.libraryFilePath())
+    cancelEvent = supersedePreview(previewKey)
+    job = None
+    try:
+        uploadFiles = request.createTempFiles()
+        with metrics.span("validate"):
+            parms = getHDAValidator(hda).validate(request.form, uploadFiles)
+        previewParms = dict(parms, **getHDAPreviewParms(hda))
+        outputFile = request.getWorkspace().file("output.zip")
+        cached_result("hdapreview", hda.libraryFilePath(), request.form, uploadFiles, outputFile,
+                      scheduled(lambda: runHDA(hda, previewParms, outputFile), priority, client,
+                                cancelEvent=cancelEvent),
+                      request.uploadHashes())
+        if request.args.get("refine", "0").lower() in ("1", "true") and not cancelEvent.is_set():
+            job = submitRefinement(hda, parms, request, client)
+    except ValidationError as e:
+        request.removeTempFiles()
+        return jsonify(e.serialize()), 400
+    except SchedulerFull as e:
+        request.removeTempFiles()
+        return schedulerFull(e)
+    except SchedulerCancelled:
+        request.removeTempFiles()
+        return jsonify({"error": "Superseded by a newer preview"}), 409
+    except Exception:
+        request.removeTempFiles()
+        raise
+    finally:
+        finishPreview(previewKey, cancelEvent, job)
+    response = flaskext.sendFile(request, outputFile, "response.zip", "application/zip", request.removeTempFiles)
+    response.headers["X-Harpoon-Preview"] = "1"
+    if job is not None:
+        response.headers["X-Harpoon-Job"] = job.id
+    return sendTimed(request, response)
+
+
+def supersedePreview(previewKey) -> threading.Event:
+    cancelEvent = threading.Event()
+    with previewsLock:
+        stale = previews.get(previewKey)
+        previews[previewKey] = (cancelEvent, None)
+        previewCounts["previews"] += 1
+        if stale is not None:
+            previewCounts["superseded"] += 1
+    if stale is not None:
+        stale[0].set()
+        if stale[1] is not None:
+            jobManager.cancel(stale[1])
+    return cancelEvent
+
+
+def finishPreview(previewKey, cancelEvent, job):
+    # Keep the entry while the refinement runs so that it can be cancelled
+    with previewsLock:
+        latest = previews.get(previewKey)
+        if latest is None or latest[0] is not cancelEvent:
+            stale = True
+        elif job is None or job.isFinished():
+            del previews[previewKey]
+            stale = False
+        else:
+            previews[previewKey] = (cancelEvent, job)
+            stale = False
+    if stale and job is not None:
+        jobManager.cancel(job)
+
+
+def submitRefinement(hda, parms, request, client):
+    # The job cooks from the uploads in the request workspace, which has to
+    # outlive the preview response
+    workspace = request.getWorkspace()
+    workspace.retain()
     uploadFiles = request.createTempFiles()
-    fillHDAParm(topNode, request.form, uploadFiles)
-    partition = topnet.createNode("partitionbyexpression")
-    partition.setFirstInput(topNode)
-    fileCompress = topnet.createNode("filecompress")
-    fileCompress.setFirstInput(partition)
-    topOutputFile = os.path.join(HARPOON_ROOT, r"temp/output/output.zip")
-    fileCompress.parm("output_filename").set(topOutputFile)
-    hou.hipFile.save("temp/project_dump.hiplc")
-    fileCompress.executeGraph(filter_static=False, block=True, generate_only=False, tops_only=False)
-    responseFile = os.path.join(HARPOON_ROOT, r"temp/response.zip")
-    shutil.copy(topOutputFile, responseFile)
-    topNode.dirtyWorkItems(True)
-    topnet.destroy()
-
-    responseData = io.BytesIO()
-    with open(responseFile, 'rb') as fo:
-        responseData.write(fo.read())
-    responseData.seek(0)
-
-    os.remove(responseFile)
-
-    request.removeTempFiles()
-
-    return send_file(responseData, mimetype="application/zip", attachment_filename="response.zip", as_attachment=True)
-
-
-def fillHDAParm(node: hou.Node, form, files):
-    for parm, value in form.items():
-        values = json.loads(value)
-        if not isinstance(values, str):
-            values = tuple(values) if (len(values) > 1) else values[0]
-        node.setParms({parm: values})
-    for parm, file in files.items():
-        node.parm(parm).set(file)
+    uploadHashes = request.uploadHashes()
+    form = request.form.to_dict()
+    hdaName = os.path.basename(hda.libraryFilePath())
+
+    def refine(job):
+        timer = metrics.RequestTimer("jobs/hdaprocessor", hdaName)
+        try:
+            return cached_result("hda", hda.libraryFilePath(), form, uploadFiles, job.outputFile(),
+                                 scheduled(lambda: runHDA(hda, parms, job.outputFile()), "batch", client, admit=False,
+                                           cancelEvent=job.cancelEvent),
+                                 uploadHashes)
+        finally:
+            timer.finish()
+    try:
+        job = jobManager.submit("hdaprocessor", hdaName, refine, workspace.release)
+    except JobQueueFull:
+        workspace.release()
+        return None
+    with previewsLock:
+        previewCounts["refinements"] += 1
+    return job
+
+
+def getHDAPreviewParms(hda) -> dict:
+    key = hdaDefinitionKey(hda)
+    parms = previewParmsCache.get(key)
+    if parms is None:
+        parms = findPreviewParms(hda.parmTemplateGroup().entries(), getHDAValidator(hda))
+        previewParmsCache.put(key, parms)
+    return parms
+
+
+def findPreviewParms(houParmTemplates, validator: ParmValidator) -> dict:
+    # Tag values are JSON like form values, e.g. harpoon_preview: [128]
+    parms = {}
+    for houParmTemplate in houParmTemplates:
+        value = houParmTemplate.tags().get(PREVIEW_TAG)
+        parmTemplate = validator.find(houParmTemplate.name())
+        if value is not None and parmTemplate is not None:
+            try:
+                parms[houParmTemplate.name()] = coerce(parmTemplate, value)
+            except ValueError as e:
+                print("Ignoring {} tag of {}: {}".format(PREVIEW_TAG, houParmTemplate.name(), e))
+        if houParmTemplate.type() == hou.parmTemplateType.Folder:
+            parms.update(findPreviewParms(houParmTemplate.parmTemplates(), validator))
+    return parms
+
+
+def runHDA(hda, parms, outputFile):
+    if workerPool is not None:
+        return workerPool.submit({
+            "type": "hda",
+            "hdaPath": hda.libraryFilePath(),
+            "parms": parms,
+            "output": outputFile
+        })
+    return cookHDA(hda, parms, outputFile)
+
+
+def cookHDA(hda, parms, outputFile):
+    with topnets.locked(hda) as template:
+        with metrics.span("parms"):
+            template.reset()
+            template.touch(list(parms.keys()))
+            fillHDAParm(template.topNode, parms)
+            template.fileCompress.parm("output_filename").set(outputFile)
+        if DUMP_HIP:
+            with metrics.span("hipsave"):
+                os.makedirs("temp/dumps", exist_ok=True)
+                hou.hipFile.save("temp/dumps/{}.hiplc".format(hda.nodeTypeName().replace(":", "_")))
+        try:
+            with metrics.span("execute"):
+                template.fileCompress.executeGraph(filter_static=False, block=True, generate_only=False, tops_only=False)
+        finally:
+            template.topNode.dirtyWorkItems(True)
+    return outputFile
+
+
+def hdabatch(hda_name, request):
+    request.timer = metrics.RequestTimer("hdabatch", hda_name)
+    with metrics.span("reload"):
+        hda = loadHDA(os.path.abspath(os.path.join("HDALibrary", hda_name)))
+    try:
+        uploadFiles = request.createTempFiles()
+        with metrics.span("validate"):
+            variants = validateVariants(hda, parseVariants(request.form), uploadFiles)
+        outputFile = request.getWorkspace().file("output.zip")
+        cached_result("hdabatch", hda.libraryFilePath(), request.form, uploadFiles, outputFile,
+                      scheduled(lambda: runHDABatch(hda, variants, outputFile), *schedulingClass(request, "batch")),
+                      request.uploadHashes())
+    except ValidationError as e:
+        request.removeTempFiles()
+        return jsonify(e.serialize()), 400
+    except SchedulerFull as e:
+        request.removeTempFiles()
+        return schedulerFull(e)
+    except ValueError as e:
+        request.removeTempFiles()
+        return jsonify({"error": str(e)}), 400
+    except Exception:
+        request.removeTempFiles()
+        raise
+    return sendTimed(request, flaskext.sendFile(request, outputFile, "response.zip", "application/zip",
+                                                request.removeTempFiles))
+
+
+def parseVariants(form) -> list:
+    # "variants" is a JSON list of {parm: value} objects, every other form
+    # field is shared by all variants
+    if "variants" not in form:
+        raise ValueError("Missing variants")
+    variants = json.loads(form["variants"])
+    if not isinstance(variants, list) or len(variants) == 0:
+        raise ValueError("variants must be a non-empty list")
+    if len(variants) > MAX_BATCH_VARIANTS:
+        raise ValueError("At most {} variants are allowed per batch".format(MAX_BATCH_VARIANTS))
+    shared = {parm: value for parm, value in form.items() if parm != "variants"}
+    variantForms = []
+    for variant in variants:
+        if not isinstance(variant, dict):
+            raise ValueError("Every variant must be an object of parameter values")
+        variantForm = dict(shared)
+        variantForm.update({parm: json.dumps(value) for parm, value in variant.items()})
+        variantForms.append(variantForm)
+    return variantForms
+
+
+def validateVariants(hda, variants, files) -> list:
+    validator = getHDAValidator(hda)
+    parms = []
+    errors = {}
+    for index, variant in enumerate(variants):
+        try:
+            parms.append(validator.validate(variant, files))
+        except ValidationError as e:
+            errors.update({"{}/{}".format(index, parm): error for parm, error in e.errors.items()})
+    if errors:
+        raise ValidationError(errors)
+    return parms
+
+
+def runHDABatch(hda, variants, outputFile):
+    if workerPool is not None:
+        return workerPool.submit({
+            "type": "hdabatch",
+            "hdaPath": hda.libraryFilePath(),
+            "variants": variants,
+            "output": outputFile
+        })
+    return cookHDABatch(hda, variants, outputFile)
+
+
+def cookHDABatch(hda, variants, outputFile):
+    # One HDA -> partitionbyexpression -> filecompress chain per variant, all
+    # merged into a single graph so PDG can schedule the variants in parallel
+    outputDir = os.path.dirname(outputFile)
+    with topnets.scene.shared():
+        topnet = hou.node("/tasks").createNode("topnet")
+        try:
+            merge = topnet.createNode("merge")
+            variantFiles = []
+            for index, variant in enumerate(variants):
+                topNode = topnet.createNode(hda.nodeTypeName())
+                fillHDAParm(topNode, variant)
+                partition = topnet.createNode("partitionbyexpression")
+                partition.setFirstInput(topNode)
+                fileCompress = topnet.createNode("filecompress")
+                fileCompress.setFirstInput(partition)
+                variantFile = os.path.join(outputDir, "variant_{}.zip".format(index))
+                fileCompress.parm("output_filename").set(variantFile)
+                merge.setInput(index, fileCompress)
+                variantFiles.append((str(index), variantFile))
+            if DUMP_HIP:
+                os.makedirs("temp/dumps", exist_ok=True)
+                hou.hipFile.save("temp/dumps/{}_batch.hiplc".format(hda.nodeTypeName().replace(":", "_")))
+            with metrics.span("execute"):
+                merge.executeGraph(filter_static=False, block=True, generate_only=False, tops_only=False)
+        finally:
+            topnet.destroy()
+    with metrics.span("zip"):
+        zipstream.mergeZips(variantFiles, outputFile)
+    for _, variantFile in variantFiles:
+        os.remove(variantFile)
+    return outputFile
+
+
+def installHDALibrary():
+    for hdaFile in os.listdir("HDALibrary"):
+        if os.path.splitext(hdaFile)[1] in HDA_EXTENSIONS:
+            loadHDA(os.path.abspath(os.path.join("HDALibrary", hdaFile)))
+
+
+def runJob(job: dict):
+    # Entry point for jobs dispatched to a worker process
+    if job["type"] == "hda":
+        hda = loadHDA(job["hdaPath"])
+        return cookHDA(hda, job["parms"], job["output"])
+    if job["type"] == "hdabatch":
+        hda = loadHDA(job["hdaPath"])
+        return cookHDABatch(hda, job["variants"], job["output"])
+    if job["type"] == "hip":
+        return cookHIP(job["hipPath"], job["force"])
+    raise ValueError("Unknown job type: {}".format(job["type"]))
+
+
+def fillHDAParm(node: hou.Node, parms):
+    # parms come validated from ParmValidator, tuples may have been turned
+    # into lists on the way to a worker process
+    node.setParms({parm: tuple(value) if isinstance(value, list) else value for parm, value in parms.items()})
 
 
 def hiplibrary(request):
-    hips = os.listdir("HIPLibrary")
-    hipLibrary = []
-    for hipFile in hips:
-        ext = os.path.splitext(hipFile)[1]
-        if ext not in ['.hip', '.hiplc']:
-            continue
-        hipLibrary.append(hipFile)
-    return jsonify(hipLibrary)
+    return jsonify(libraryWatcher.names("HIPLibrary"))
 
 def hipprocessor(hip, request):
     hipPath = os.path.abspath(os.path.join("HIPLibrary", hip))
-    hou.hipFile.load(hipPath, ignore_load_warnings=True)
-    top = hou.node("/tasks/ENTRY")
-    top.dirtyAllWorkItems(False)
-    top.cookWorkItems(block=True, tops_only=False)
+    # ?force=1 re-cooks every work item instead of only the dirty ones
+    force = request.args.get("force", "0").lower() in ("1", "true")
+    timer = metrics.RequestTimer("hipprocessor", hip)
+    try:
+        scheduled(lambda: runHIP(hipPath, force), *schedulingClass(request))()
+    except SchedulerFull as e:
+        return schedulerFull(e)
+    finally:
+        timer.finish()
     return "1"
 
+
+def runHIP(hipPath, force=False):
+    if workerPool is not None:
+        with metrics.span("cook"):
+            return workerPool.submit({
+                "type": "hip",
+                "hipPath": hipPath,
+                "force": force
+            }, affinity=hipPath)
+    return cookHIP(hipPath, force)
+
+
+def cookHIP(hipPath, force=False):
+    # The loaded scene stays resident between calls and is only reloaded
+    # when another hip is asked for or the file changed on disk
+    global loadedHip
+    with hipLock:
+        stat = fileStat(hipPath)
+        if loadedHip != (hipPath, stat):
+            loadedHip = None
+            with metrics.span("load"):
+                topnets.replaceScene(lambda: hou.hipFile.load(hipPath, ignore_load_warnings=True))
+            loadedHip = (hipPath, stat)
+            force = True
+        top = hou.node("/tasks/ENTRY")
+        if force:
+            top.dirtyAllWorkItems(False)
+        with metrics.span("cook"):
+            top.cookWorkItems(block=True, tops_only=False)
+    return hipPath
+
 def torlibrary(request):
-    tors = os.listdir("TORLibrary")
-    torLibrary = []
-    for torFile in tors:
-        ext = os.path.splitext(torFile)[1]
-        if ext not in ['.tor']:
-            continue
-        torLibrary.append(torFile)
-    return jsonify(torLibrary)
+    return jsonify(libraryWatcher.names("TORLibrary"))
+
+@libraryWatcher.listener("TORLibrary")
+def tor_library_changed(changed, removed):
+    # Drop removed projects and generate nodemaps of new and changed ones
+    # before anyone asks for them
+    with torNodemapsLock:
+        for tor_name in removed:
+            tor_file = os.path.abspath(os.path.join("TORLibrary", tor_name))
+            torNodemaps.pop(tor_file, None)
+            assetDigests.pop(tor_file, None)
+            parmValidatorCache.discard(lambda key: key[0] == tor_file)
+    if shutil.which(GAEA_CLI) is None:
+        return
+    for tor_name in changed:
+        try:
+            loadTOR(tor_name)
+        except Exception as e:
+            print("Generating nodemap of {} failed: {}".format(tor_name, e))
 
 def get_file_md5(file):
     m = hashlib.md5()
     with open(file, 'rb') as fp:
-        while True:
-            data = fp.read(4096)
-            if not data:
-                break
-            m.update(data)
+        size = os.fstat(fp.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                m.update(data)
+        else:
+            while True:
+                data = fp.read(HASH_CHUNK_SIZE)
+                if not data:
+                    break
+                m.update(data)
     return m.hexdigest()
 
 def read_md5_file(file) -> str:
@@ -146,72 +761,322 @@ def write_md5_file(file, md5):
     with open(file, 'w') as fp:
         fp.write(md5)
 
+def get_asset_md5(file):
+    stat = fileStat(file)
+    cached = assetDigests.get(file)
+    if cached is None or cached[0] != stat:
+        cached = (stat, get_file_md5(file))
+        assetDigests[file] = cached
+    return cached[1]
+
+def normalize_form_value(value):
+    try:
+        return json.dumps(json.loads(value), sort_keys=True, separators=(",", ":"))
+    except ValueError:
+        return value
+
+def result_key(kind, asset_file, form, files, file_hashes=None):
+    file_hashes = file_hashes or {}
+    parts = [kind, get_asset_md5(asset_file)]
+    for parm in sorted(form.keys()):
+        parts += [parm, normalize_form_value(form[parm])]
+    for parm in sorted(files.keys()):
+        parts += [parm, file_hashes.get(parm) or get_file_md5(files[parm])]
+    return ResultCache.key(*parts)
+
+def cached_result(kind, asset_file, form, files, output_file, cook, file_hashes=None):
+    # Serve deterministic cooks from the result cache when it is enabled, and
+    # let identical requests share a cook that is already running
+    if resultCache is None and cookFlights is None:
+        with metrics.span("cook"):
+            return cook()
+    with metrics.span("cache"):
+        key = result_key(kind, asset_file, form, files, file_hashes)
+        if resultCache is not None and resultCache.fetch(key, output_file):
+            return output_file
+    with metrics.span("cook"):
+        cooked = coalesce(key, [output_file], cook)
+    if resultCache is not None and cooked:
+        with metrics.span("cache"):
+            resultCache.put(key, output_file)
+    return output_file
+
+def coalesce(key, output_files, cook) -> bool:
+    # False if the outputs were linked from an identical cook in flight
+    if cookFlights is None:
+        cook()
+        return True
+    return cookFlights.run(key, output_files, cook)
+
+
+def loadTOR(tor_file):
+    tor_file = os.path.abspath(os.path.join("TORLibrary", tor_file))
+    # Only re-hashes the project when its size or mtime changed
+    tor_md5 = get_asset_md5(tor_file)
+    cached = torNodemaps.get(tor_file)
+    if cached is not None and cached[0] == tor_md5:
+        return tor_file, cached[1]
+
+    with torNodemapsLock:
+        nodemap_file = os.path.splitext(tor_file)[0] + ".xml"
+        md5_file = os.path.splitext(tor_file)[0] + ".md5"
+        nodemap_outdated = True
+        if os.path.exists(nodemap_file) and os.path.exists(md5_file):
+            nodemap_md5 = read_md5_file(md5_file)
+            if tor_md5 == nodemap_md5:
+                nodemap_outdated = False
+
+        if nodemap_outdated:
+            print("MD5 changed Updating Nodemap")
+            with metrics.span("nodemap"):
+                gaeaRunner.run([tor_file, "--nodemap"])
+            write_md5_file(md5_file, tor_md5)
+        templates = ParmTemplateGroup.FromTorNodeMap(ElementTree.parse(nodemap_file))
+        torNodemaps[tor_file] = (tor_md5, templates)
+    return tor_file, templates
+
 
 def torprocessor(tor_file, request):
     if shutil.which(GAEA_CLI) is None:
         return r"Gaea processor not available: Gaea-CLI not found"
-    tor_file = os.path.abspath(os.path.join("TORLibrary", tor_file))
-    nodemap_file = os.path.splitext(tor_file)[0] + ".xml"
-    md5_file = os.path.splitext(tor_file)[0] + ".md5"
-    nodemap_outdated = True
-    tor_md5 = get_file_md5(tor_file)
-    if os.path.exists(nodemap_file) and os.path.exists(md5_file):
-        nodemap_md5 = read_md5_file(md5_file)
-        if tor_md5 == nodemap_md5:
-            nodemap_outdated = False
-
-    if nodemap_outdated:
-        print("MD5 changed Updating Nodemap")
-        os.system(r"{0} {1} --nodemap".format(GAEA_CLI, tor_file))
-        write_md5_file(md5_file, tor_md5)
-    templates = ParmTemplateGroup.FromTorNodeMap(ElementTree.parse(nodemap_file))
+    if request.method == 'POST':
+        request.timer = metrics.RequestTimer("torprocessor", tor_file)
+    try:
+        with metrics.span("reload"):
+            tor_file, templates = loadTOR(tor_file)
+    except GaeaError as e:
+        request.removeTempFiles()
+        return gaea_error(e)
     if request.method == 'GET':
         return torprocessor_get(tor_file, templates, request)
     else:
         return torprocessor_post(tor_file, templates, request)
 
+def get_tor_validator(tor_file, templates: ParmTemplateGroup) -> ParmValidator:
+    # Gaea gets the coerced values, menu tokens as their index
+    key = (tor_file, get_asset_md5(tor_file))
+    validator = parmValidatorCache.get(key)
+    if validator is None:
+        validator = ParmValidator(templates)
+        parmValidatorCache.put(key, validator)
+    return validator
+
 def torprocessor_get(tor_file: str, templates : ParmTemplateGroup, request):
-    return jsonify(templates.serialize())
+    try:
+        query = parseParmTemplateQuery(request.args)
+        if query is None:
+            return Response(templates.toJson(), mimetype="application/json")
+        return jsonify(templates.view(**query))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 404
 
 def torprocessor_post(tor_file, templates: ParmTemplateGroup, request):
-    #os.system(r"{0} {1} --nodemap".format(GAEA_CLI, tor))
-    upload_files = request.createTempFiles()
-    cmd = "{0} {1} ".format(GAEA_CLI, tor_file)
-    variables = ""
-    temp_dir = os.path.abspath("./temp")
+    try:
+        compression, level = zipstream.parseCompression(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        upload_files = request.createTempFiles()
+        with metrics.span("validate"):
+            parms = get_tor_validator(tor_file, templates).validate(request.form, upload_files)
+        workspace = request.getWorkspace()
+        response_file = workspace.file("response.zip")
+        key = None
+        if resultCache is not None or cookFlights is not None:
+            with metrics.span("cache"):
+                key = result_key("tor", tor_file, request.form, upload_files, request.uploadHashes())
+                hit = resultCache is not None and resultCache.fetch(key, response_file)
+            if hit:
+                return sendTimed(request, flaskext.sendFile(request, response_file, "response.zip", "application/zip",
+                                                            request.removeTempFiles))
+        output_files = [output_file for _, output_file in tor_outputs(templates, workspace.path)]
+        coalesce(key, output_files,
+                 scheduled(lambda: runGaea(tor_file, templates, parms, workspace.path,
+                                           gaea_timeout(request.args)), *schedulingClass(request)))
+    except ValidationError as e:
+        request.removeTempFiles()
+        return jsonify(e.serialize()), 400
+    except SchedulerFull as e:
+        request.removeTempFiles()
+        return schedulerFull(e)
+    except GaeaError as e:
+        request.removeTempFiles()
+        return gaea_error(e)
+    except Exception:
+        request.removeTempFiles()
+        raise
+
+    # Send each output while the archive is being assembled, and keep a copy
+    # of it for the result cache when that is enabled
+    on_complete = (lambda: resultCache.put(key, response_file)) if resultCache is not None else None
+    chunks = zipstream.streamZip(output_files, compression, level,
+                                 response_file if resultCache is not None else None, on_complete)
+    response = Response(chunks, mimetype="application/zip")
+    response.headers.set("Content-Disposition", "attachment", filename="response.zip")
+    response.call_on_close(request.removeTempFiles)
+    # compression happens while the archive is sent
+    return sendTimed(request, response, "zip")
+
+
+def buildTOR(tor_file, templates: ParmTemplateGroup, parms, response_file, compression=None, level=None,
+             timeout=None, cancel_event=None):
+    output_files = runGaea(tor_file, templates, parms, os.path.dirname(response_file), timeout, cancel_event)
+    with metrics.span("zip"):
+        return zipstream.writeZip(output_files, response_file, compression, level)
+
+
+def tor_outputs(templates: ParmTemplateGroup, output_dir):
+    # (parm, file) for every output port of the project
+    return [(template.name, os.path.join(output_dir, "{0}.exr".format(template.name)))
+            for template in templates.parmTemplates if template.isHidden]
+
+
+def runGaea(tor_file, templates: ParmTemplateGroup, parms, output_dir, timeout=None, cancel_event=None):
+    # parms as returned by the validator, uploads map to their files
+    args = [tor_file]
     output_files = []
-    for template in templates.parmTemplates:
-        if template.isHidden:
-            output_file = "{0}\{1}.exr".format(temp_dir, template.name)
-            variables += " {0}:{1}".format(template.name, output_file)
-            output_files.append(output_file)
-    for parm, value in request.form.items():
-        values = json.loads(value)
-        if not isinstance(values, str):
-            values = tuple(values) if (len(values) > 1) else values[0]
-        elif len(values) == 0:
+    for parm, output_file in tor_outputs(templates, output_dir):
+        args.append("{0}:{1}".format(parm, output_file))
+        output_files.append(output_file)
+    toggles = {template.name for template in templates.parmTemplates if template.type == "Toggle"}
+    for parm, value in parms.items():
+        if parm in toggles:
+            value = bool(value)
+        elif value == "":
             continue
-        variables += " {0}:{1}".format(parm, values)
+        args.append("{0}:{1}".format(parm, value))
+
+    with metrics.span("gaea"):
+        gaeaRunner.run(args, timeout, cancel_event)
+
+    missing = [output_file for output_file in output_files if not os.path.exists(output_file)]
+    if len(missing) > 0:
+        raise RuntimeError("Gaea build did not write {}".format(", ".join(missing)))
+    return output_files
+
+
+def gaea_timeout(args):
+    # A request may ask for a shorter timeout than the server default, never a longer one
+    timeout = args.get("timeout", type=float)
+    if gaeaRunner.timeout is not None:
+        timeout = min(timeout or gaeaRunner.timeout, gaeaRunner.timeout)
+    return timeout
+
+
+def gaea_error(error: GaeaError):
+    body = {"error": str(error)}
+    if error.result is not None:
+        body.update(error.result.serialize())
+    return jsonify(body), 504 if isinstance(error, GaeaTimeout) else 500
+
+
+def joblist(request):
+    return jsonify({
+        "stats": jobManager.stats(),
+        "jobs": [job.serialize() for job in jobManager.list()]
+    })
+
+
+def jobsubmit(processor, asset, request):
+    priority, client = schedulingClass(request, "batch")
+
+    def jobScheduled(job, cook):
+        # Jobs were admitted by the job queue, they wait for a slot however
+        # busy the scheduler is. The slot is only taken once the job cooks
+        # itself, a cache hit or a job sharing a cook in flight needs none.
+        return scheduled(cook, priority, client, admit=False, cancelEvent=job.cancelEvent)
+
+    if processor == "hdaprocessor":
+        hda = loadHDA(os.path.abspath(os.path.join("HDALibrary", asset)))
+        try:
+            parms = getHDAValidator(hda).validate(request.form, request.createTempFiles())
+        except ValidationError as e:
+            request.removeTempFiles()
+            return jsonify(e.serialize()), 400
+        run = lambda job, form, files, hashes: cached_result("hda", hda.libraryFilePath(), form, files, job.outputFile(),
+                                                            jobScheduled(job, lambda: runHDA(hda, parms, job.outputFile())),
+                                                            hashes)
+    elif processor == "hdabatch":
+        hda = loadHDA(os.path.abspath(os.path.join("HDALibrary", asset)))
+        try:
+            variants = validateVariants(hda, parseVariants(request.form), request.createTempFiles())
+        except ValidationError as e:
+            request.removeTempFiles()
+            return jsonify(e.serialize()), 400
+        except ValueError as e:
+            request.removeTempFiles()
+            return jsonify({"error": str(e)}), 400
+        run = lambda job, form, files, hashes: cached_result("hdabatch", hda.libraryFilePath(), form, files, job.outputFile(),
+                                                            jobScheduled(job, lambda: runHDABatch(hda, variants, job.outputFile())),
+                                                            hashes)
+    elif processor == "torprocessor":
+        if shutil.which(GAEA_CLI) is None:
+            return jsonify({"error": "Gaea processor not available: Gaea-CLI not found"}), 503
+        try:
+            compression, level = zipstream.parseCompression(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        timeout = gaea_timeout(request.args)
+        try:
+            tor_file, templates = loadTOR(asset)
+        except GaeaError as e:
+            return gaea_error(e)
+        try:
+            parms = get_tor_validator(tor_file, templates).validate(request.form, request.createTempFiles())
+        except ValidationError as e:
+            request.removeTempFiles()
+            return jsonify(e.serialize()), 400
+        # the job output is a zip, the synchronous "tor" cook writes the bare
+        # outputs, so the two must not share a flight
+        run = lambda job, form, files, hashes: cached_result("torjob", tor_file, form, files, job.outputFile(),
+                                                            jobScheduled(job, lambda: buildTOR(tor_file, templates, parms, job.outputFile(),
+                                                                                               compression, level, timeout,
+                                                                                               job.cancelEvent)),
+                                                            hashes)
+    else:
+        return jsonify({"error": "Unknown processor: {}".format(processor)}), 404
+
+    uploadFiles = request.createTempFiles()
+    uploadHashes = request.uploadHashes()
+    form = request.form.to_dict()
+
+    def timed(job):
+        timer = metrics.RequestTimer("jobs/" + processor, asset)
+        try:
+            return run(job, form, uploadFiles, uploadHashes)
+        finally:
+            timer.finish()
+    try:
+        job = jobManager.submit(processor, asset, timed, request.removeTempFiles)
+    except JobQueueFull as e:
+        request.removeTempFiles()
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "10"}
+    return jsonify(job.serialize()), 202, {"Location": "/api/jobs/{}".format(job.id)}
 
-    for parm, file in upload_files.items():
-        variables += " {0}:{1}".format(parm, file)
 
-    cmd += variables
-    os.system(cmd)
+def job(job_id, request):
+    job = jobManager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job: {}".format(job_id)}), 404
+    if request.method == 'DELETE':
+        jobManager.remove(job)
+    return jsonify(job.serialize())
 
-    response_file = os.path.abspath("./temp/response.zip")
-    zip_file = zipfile.ZipFile(response_file, "w")
-    for output_file in output_files:
-        zip_file.write(output_file, os.path.basename(output_file), compress_type = zipfile.ZIP_DEFLATED)
-        os.remove(output_file)
-    zip_file.close()
 
-    response_data = io.BytesIO()
-    with open(response_file, 'rb') as fo:
-        response_data.write(fo.read())
-    response_data.seek(0)
+def jobevents(job_id, request):
+    job = jobManager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job: {}".format(job_id)}), 404
+    events = (json.dumps(state) + "\n" for state in jobManager.watch(job))
+    return Response(events, mimetype="application/x-ndjson")
 
-    os.remove(response_file)
 
-    request.removeTempFiles()
-    return send_file(response_data, mimetype="application/zip", attachment_filename="response.zip", as_attachment=True)
\ No newline at end of file
+def jobresult(job_id, request):
+    job = jobManager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job: {}".format(job_id)}), 404
+    if job.status != "done":
+        return jsonify(job.serialize()), 409
+    return flaskext.sendFile(request, job.result, "response.zip", "application/zip")
\ No newline at end of file
@@ -0,0 +1,95 @@
+import os
+import json
+import hashlib
+import threading
+from lib.lazyimport import hou
+from flask import Response
+
+HDA_EXTENSIONS = ['.hda', '.otl', '.hdalc', '.otllc']
+
+
+def fileStat(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class HDACatalog:
+    # Persistent index of HDALibrary keyed by file name, size and mtime.
+    # Only files whose stat changed are re-parsed with hou.hda.definitionsInFile.
+
+    def __init__(self, libraryDir, indexFile):
+        self.libraryDir = libraryDir
+        self.indexFile = indexFile
+        self.entries = {}
+        self.body = b""
+        self.etag = ""
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.indexFile):
+            return
+        try:
+            with open(self.indexFile, "r") as fp:
+                self.entries = json.load(fp)
+        except (OSError, ValueError):
+            self.entries = {}
+        self.rebuildBody()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.indexFile) or ".", exist_ok=True)
+        tempFile = self.indexFile + ".tmp"
+        with open(tempFile, "w") as fp:
+            json.dump(self.entries, fp)
+        os.replace(tempFile, self.indexFile)
+
+    def parse(self, hdaPath, stat):
+        definition = hou.hda.definitionsInFile(hdaPath)[0]
+        if not definition.isInstalled():
+            hou.hda.installFile(hdaPath)
+        return {
+            "stat": stat,
+            "nodeTypeCategory": definition.nodeTypeCategory().name(),
+            "nodeTypeName": definition.nodeTypeName(),
+            "description": definition.description()
+        }
+
+    def refresh(self):
+        with self.lock:
+            entries = {}
+            changed = False
+            for hdaFile in sorted(os.listdir(self.libraryDir)):
+                ext = os.path.splitext(hdaFile)[1]
+                if ext not in HDA_EXTENSIONS:
+                    continue
+                hdaPath = os.path.join(self.libraryDir, hdaFile)
+                entry = self.entries.get(hdaFile)
+                try:
+                    stat = fileStat(hdaPath)
+                    if entry is None or entry["stat"] != stat:
+                        entry = self.parse(hdaPath, stat)
+                        changed = True
+                except Exception as e:
+                    # left out of the index and parsed again next refresh
+                    print("Indexing {} failed: {}".format(hdaFile, e))
+                    continue
+                entries[hdaFile] = entry
+            if changed or entries.keys() != self.entries.keys():
+                self.entries = entries
+                self.rebuildBody()
+                self.save()
+
+    def rebuildBody(self):
+        hdaLibrary = {}
+        for hdaFile, entry in self.entries.items():
+            nodeType = entry["nodeTypeCategory"]
+            if nodeType not in hdaLibrary:
+                hdaLibrary[nodeType] = {}
+            hdaLibrary[nodeType][hdaFile] = entry["description"]
+        self.body = json.dumps(hdaLibrary).encode()
+        self.etag = hashlib.sha1(self.body).hexdigest()
+
+    def response(self, request):
+        response = Response(self.body, mimetype="application/json")
+        response.set_etag(self.etag)
+        return response.make_conditional(request)
@@ -1,40 +1,126 @@
 import os
-import shutil
-import datetime
+import io
 import hashlib
 import flask
-from datetime import datetime
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.utils import secure_filename
+from lib.workspace import Workspace
+
+# Maximum number of uploaded bytes per request, None for unlimited
+UPLOAD_LIMIT = None
+
+
+def uploadName(filename) -> str:
+    # secure_filename drops non-ASCII characters, "地形.png" would come out as
+    # "png". Houdini and Gaea pick the reader by extension, so keep it.
+    stem, ext = os.path.splitext(filename or "")
+    if secure_filename(stem):
+        return secure_filename(filename)
+    return "upload" + os.path.splitext(secure_filename("x" + ext))[1]
+
+
+class UploadStream:
+    # File object handed to Werkzeug's multipart parser. Uploads are written
+    # straight into the request workspace chunk by chunk and hashed on the way.
+
+    def __init__(self, request: flask.Request, filename):
+        uploads = getUploads(request)
+        name = uploadName(filename)
+        self.request = request
+        self.path = getWorkspace(request).file("uploads", str(len(uploads)), name)
+        self.file = open(self.path, "w+b")
+        self.md5 = hashlib.md5()
+        uploads.append(self)
+
+    def write(self, data):
+        self.request.uploadedBytes += len(data)
+        if UPLOAD_LIMIT is not None and self.request.uploadedBytes > UPLOAD_LIMIT:
+            raise RequestEntityTooLarge()
+        self.md5.update(data)
+        return self.file.write(data)
+
+    def hexdigest(self) -> str:
+        return self.md5.hexdigest()
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+class ClosingFile(io.FileIO):
+    # Runs a callback once the WSGI server closes the file after sending it.
+    # send_file responses are passed through directly, so Response.call_on_close
+    # would never fire for them.
+
+    def __init__(self, path, onClose=None):
+        super().__init__(path, "rb")
+        self.onClose = onClose
+
+    def close(self):
+        if self.closed:
+            return
+        super().close()
+        if self.onClose is not None:
+            self.onClose()
+
+
+def sendFile(request: flask.Request, path, attachmentName, mimetype, cleanup=None):
+    # Stream a file from disk with ETag and Range support, without loading it
+    # into memory, and run cleanup once it has been sent.
+    stat = os.stat(path)
+    file = ClosingFile(path, cleanup)
+    response = flask.send_file(file, mimetype=mimetype, attachment_filename=attachmentName, as_attachment=True,
+                               conditional=False)
+    response.content_length = stat.st_size
+    response.last_modified = stat.st_mtime
+    response.set_etag("{}-{}".format(stat.st_mtime_ns, stat.st_size))
+    try:
+        return response.make_conditional(request, accept_ranges=True, complete_length=stat.st_size)
+    except Exception:
+        file.close()
+        raise
+
+
+def getWorkspace(request: flask.Request) -> Workspace:
+    if getattr(request, "workspace", None) is None:
+        request.workspace = Workspace()
+    return request.workspace
+
+
+def getUploads(request: flask.Request) -> list:
+    if getattr(request, "uploads", None) is None:
+        request.uploads = []
+        request.uploadedBytes = 0
+    return request.uploads
+
+
+def getFileStream(request: flask.Request, total_content_length, content_type, filename=None, content_length=None):
+    return UploadStream(request, filename)
 
 
 def createTempFiles(request: flask.Request):
     tempFiles = {}
-    requestHash = getHash(request)
-    tempDir = f"temp/uploads/{requestHash}"
-    os.makedirs(tempDir)
     for parm, file in request.files.items():
-        filePath = os.path.abspath(f"{tempDir}/{file.filename}")
-        file.save(filePath)
-        tempFiles[parm] = filePath
+        file.stream.flush()
+        tempFiles[parm] = file.stream.path
     return tempFiles
 
 
-def removeTempFiles(request: flask.Request):
-    requestHash = getHash(request)
-    tempDir = os.path.abspath(f"temp/uploads/{requestHash}")
-    shutil.rmtree(tempDir)
+def uploadHashes(request: flask.Request):
+    return {parm: file.stream.hexdigest() for parm, file in request.files.items()}
 
 
-def getHash(request: flask.Request):
-    if getattr(request, 'timestamp', None) is None:
-        timestamp = datetime.now().timestamp()
-        if request.date is not None:
-            timestamp = request.date().timestamp()
-        setattr(request, "timestamp", timestamp)
-    timestamp = int(request.timestamp)
-    client = str(request.remote_addr)
-    path = request.path
-    return hashlib.sha256(f"{timestamp}_{client}_{path}".encode()).hexdigest()
+def removeTempFiles(request: flask.Request):
+    for upload in getUploads(request):
+        upload.close()
+    if getattr(request, "workspace", None) is not None:
+        request.workspace.release()
+        request.workspace = None
+    if getattr(request, "timer", None) is not None:
+        request.timer.finish()
 
 
+flask.Request._get_file_stream = getFileStream
+flask.Request.getWorkspace = getWorkspace
 flask.Request.createTempFiles = createTempFiles
+flask.Request.uploadHashes = uploadHashes
 flask.Request.removeTempFiles = removeTempFiles
@@ -0,0 +1,136 @@
+import os
+import time
+import signal
+import threading
+import subprocess
+
+# Builds run in their own process group so that killing one also ends the
+# processes Gaea started, which would otherwise keep the output pipes open
+if os.name == "nt":
+    PROCESS_GROUP = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+else:
+    PROCESS_GROUP = {"start_new_session": True}
+
+
+def killProcessGroup(process: subprocess.Popen):
+    if os.name == "nt":
+        subprocess.call(["taskkill", "/F", "/T", "/PID", str(process.pid)], stdout=subprocess.DEVNULL,
+                        stderr=subprocess.DEVNULL)
+    else:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+    process.kill()
+
+
+class GaeaError(Exception):
+
+    def __init__(self, message, result=None):
+        super().__init__(message)
+        self.result = result
+
+
+class GaeaTimeout(GaeaError):
+    pass
+
+
+class GaeaCancelled(GaeaError):
+    pass
+
+
+class GaeaResult:
+
+    def __init__(self, args, returncode, stdout, stderr, duration):
+        self.args = args
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.duration = duration
+
+    def serialize(self) -> dict:
+        return {
+            "returncode": self.returncode,
+            "duration": self.duration,
+            "stdout": self.stdout[-4096:],
+            "stderr": self.stderr[-4096:]
+        }
+
+
+class GaeaRunner:
+    # Launches Gaea builds as argument-list subprocesses, at most maxConcurrent
+    # at a time, with optional timeouts and cancellation.
+
+    POLL_INTERVAL = 0.25
+
+    def __init__(self, executable, maxConcurrent=None, timeout=None):
+        self.executable = executable
+        self.maxConcurrent = maxConcurrent or os.cpu_count()
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(self.maxConcurrent)
+        self.running = 0
+        self.waiting = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.lock = threading.Lock()
+
+    def count(self, counter, delta=1):
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + delta)
+
+    def run(self, args, timeout=None, cancelEvent=None) -> GaeaResult:
+        timeout = timeout or self.timeout
+        args = [self.executable] + [str(arg) for arg in args]
+        self.count("waiting")
+        with self.slots:
+            self.count("waiting", -1)
+            self.count("running")
+            try:
+                return self.execute(args, timeout, cancelEvent)
+            finally:
+                self.count("running", -1)
+
+    def execute(self, args, timeout, cancelEvent) -> GaeaResult:
+        if cancelEvent is not None and cancelEvent.is_set():
+            self.count("cancelled")
+            raise GaeaCancelled("Gaea build cancelled")
+        start = time.time()
+        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True,
+                                   **PROCESS_GROUP)
+        while True:
+            try:
+                stdout, stderr = process.communicate(timeout=self.POLL_INTERVAL)
+                break
+            except subprocess.TimeoutExpired:
+                if cancelEvent is not None and cancelEvent.is_set():
+                    killProcessGroup(process)
+                    stdout, stderr = process.communicate()
+                    self.count("cancelled")
+                    raise GaeaCancelled("Gaea build cancelled", GaeaResult(args, process.returncode, stdout, stderr,
+                                                                           time.time() - start))
+                if timeout is not None and time.time() - start > timeout:
+                    killProcessGroup(process)
+                    stdout, stderr = process.communicate()
+                    self.count("timeouts")
+                    raise GaeaTimeout("Gaea build timed out after {}s".format(timeout),
+                                      GaeaResult(args, process.returncode, stdout, stderr, time.time() - start))
+        result = GaeaResult(args, process.returncode, stdout, stderr, time.time() - start)
+        if process.returncode != 0:
+            self.count("failed")
+            raise GaeaError("Gaea build failed with exit code {}".format(process.returncode), result)
+        self.count("completed")
+        return result
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "maxConcurrent": self.maxConcurrent,
+                "running": self.running,
+                "waiting": self.waiting,
+                "completed": self.completed,
+                "failed": self.failed,
+                "timeouts": self.timeouts,
+                "cancelled": self.cancelled
+            }
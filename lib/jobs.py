@@ -0,0 +1,172 @@
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from lib.workspace import Workspace
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job:
+
+    def __init__(self, kind, asset, directory):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.asset = asset
+        self.workspace = Workspace(directory)
+        self.status = "queued"
+        self.stage = "queued"
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.future = None
+        self.cleanup = []
+        self.cancelEvent = threading.Event()
+        self.version = 0
+        self.changed = threading.Condition()
+
+    def update(self, **fields):
+        with self.changed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.version += 1
+            self.changed.notify_all()
+
+    def isFinished(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+    def outputFile(self, name="response.zip") -> str:
+        return self.workspace.file(name)
+
+    def serialize(self) -> dict:
+        now = time.time()
+        queuedTime = (self.started or self.finished or now) - self.submitted
+        runTime = (self.finished or now) - self.started if self.started is not None else 0.0
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "asset": self.asset,
+            "status": self.status,
+            "stage": self.stage,
+            "submitted": self.submitted,
+            "queuedTime": queuedTime,
+            "runTime": runTime,
+            "error": self.error
+        }
+
+
+class JobManager:
+    # Runs processor jobs on a bounded thread pool. Every job gets a workspace
+    # under <directory> that keeps its result until it is deleted or expires.
+
+    def __init__(self, directory, maxWorkers=1, maxQueued=64, retention=3600):
+        self.directory = directory
+        self.maxWorkers = maxWorkers
+        self.maxQueued = maxQueued
+        self.retention = retention
+        self.jobs = {}
+        self.executor = None
+        self.draining = False
+        self.lock = threading.Lock()
+
+    def queueDepth(self) -> int:
+        return sum(1 for job in self.jobs.values() if job.status == "queued")
+
+    def submit(self, kind, asset, fn, cleanup=None) -> Job:
+        self.expire()
+        with self.lock:
+            if self.draining:
+                raise JobQueueFull("Server is shutting down")
+            if self.queueDepth() >= self.maxQueued:
+                raise JobQueueFull("{} jobs already queued".format(self.maxQueued))
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.maxWorkers, thread_name_prefix="harpoon-job")
+            job = Job(kind, asset, self.directory)
+            if cleanup is not None:
+                job.cleanup.append(cleanup)
+            self.jobs[job.id] = job
+            job.future = self.executor.submit(self.run, job, fn)
+        return job
+
+    def run(self, job: Job, fn):
+        if job.status == "cancelled":
+            return
+        job.update(status="running", stage="running", started=time.time())
+        try:
+            result = fn(job)
+            job.update(status="done", stage="done", result=result, finished=time.time())
+        except Exception as e:
+            status = "cancelled" if job.cancelEvent.is_set() else "failed"
+            job.update(status=status, stage=status, error=repr(e), finished=time.time())
+        finally:
+            for cleanup in job.cleanup:
+                cleanup()
+            job.cleanup = []
+            if job.id not in self.jobs:
+                job.workspace.release()
+
+    def drain(self, timeout=None) -> bool:
+        # Stop taking jobs and wait for the queued and running ones to finish
+        with self.lock:
+            self.draining = True
+            futures = [job.future for job in self.jobs.values() if job.future is not None and not job.isFinished()]
+        done, pending = wait(futures, timeout)
+        return len(pending) == 0
+
+    def get(self, jobId) -> Job:
+        return self.jobs.get(jobId)
+
+    def list(self) -> list:
+        self.expire()
+        return list(self.jobs.values())
+
+    def cancel(self, job: Job) -> bool:
+        # Queued jobs are dropped, running ones are asked to stop through
+        # their cancel event
+        job.cancelEvent.set()
+        if job.future is not None and job.future.cancel():
+            job.update(status="cancelled", stage="cancelled", finished=time.time())
+            for cleanup in job.cleanup:
+                cleanup()
+            job.cleanup = []
+            return True
+        return False
+
+    def remove(self, job: Job):
+        self.cancel(job)
+        with self.lock:
+            self.jobs.pop(job.id, None)
+        if job.isFinished():
+            job.workspace.release()
+
+    def expire(self):
+        deadline = time.time() - self.retention
+        for job in list(self.jobs.values()):
+            if job.isFinished() and job.finished < deadline:
+                self.remove(job)
+
+    def watch(self, job: Job, timeout=30.0):
+        # Yield the job state every time it changes until it finishes
+        version = -1
+        while True:
+            with job.changed:
+                if job.version == version:
+                    job.changed.wait(timeout)
+                version = job.version
+                state = job.serialize()
+            yield state
+            if job.isFinished():
+                return
+
+    def stats(self) -> dict:
+        jobs = list(self.jobs.values())
+        return {
+            "maxWorkers": self.maxWorkers,
+            "queueDepth": sum(1 for job in jobs if job.status == "queued"),
+            "running": sum(1 for job in jobs if job.status == "running"),
+            "finished": sum(1 for job in jobs if job.isFinished())
+        }
@@ -0,0 +1,41 @@
+import time
+import importlib
+import threading
+
+
+class LazyModule:
+    # Stands in for a module that is slow to import until one of its
+    # attributes is used. hou pulls in all of Houdini, importing it lazily
+    # lets the server bind its port first.
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._importSeconds = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    start = time.time()
+                    module = importlib.import_module(self._name)
+                    self._importSeconds = time.time() - start
+                    self._module = module
+        return self._module
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+
+def load(module: LazyModule) -> float:
+    # Import now, returns how long the import took
+    module._load()
+    return module._importSeconds
+
+
+def isLoaded(module: LazyModule) -> bool:
+    return module._module is not None
+
+
+hou = LazyModule("hou")
@@ -0,0 +1,83 @@
+import os
+import time
+import threading
+from lib.catalog import fileStat
+
+
+class Library:
+    # Files of one library directory with the stat they had when last seen
+
+    def __init__(self, directory, extensions):
+        self.directory = directory
+        self.extensions = extensions
+        self.files = {}
+        self.listeners = []
+
+    def names(self) -> list:
+        return sorted(self.files)
+
+    def scan(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            names = []
+        files = {}
+        for name in names:
+            if os.path.splitext(name)[1] not in self.extensions:
+                continue
+            try:
+                files[name] = fileStat(os.path.join(self.directory, name))
+            except OSError:
+                # removed while listing
+                continue
+        changed = [name for name in sorted(files) if self.files.get(name) != files[name]]
+        removed = [name for name in sorted(self.files) if name not in files]
+        self.files = files
+        if not changed and not removed:
+            return
+        for listener in self.listeners:
+            try:
+                listener(changed, removed)
+            except Exception as e:
+                # requests still load the asset on demand
+                print("Updating {} failed: {}".format(self.directory, e))
+
+
+class LibraryWatcher:
+    # Polls the asset libraries and keeps one index of them for the listing
+    # endpoints. Listeners get (changed, removed) file names after each scan
+    # that found a difference, so assets can be prepared off the request path.
+    # Until the watcher is started the libraries are scanned on every lookup.
+
+    def __init__(self, libraries: dict):
+        self.libraries = {directory: Library(directory, extensions) for directory, extensions in libraries.items()}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def listener(self, directory):
+        def register(listener):
+            self.libraries[directory].listeners.append(listener)
+            return listener
+        return register
+
+    def scan(self):
+        with self.lock:
+            for library in self.libraries.values():
+                library.scan()
+
+    def refresh(self):
+        if self.thread is None:
+            self.scan()
+
+    def names(self, directory) -> list:
+        self.refresh()
+        return self.libraries[directory].names()
+
+    def start(self, interval=2.0):
+        def watch():
+            while True:
+                self.scan()
+                time.sleep(interval)
+        self.thread = threading.Thread(target=watch, name="harpoon-library-watcher", daemon=True)
+        self.thread.start()
+        return self.thread
@@ -0,0 +1,194 @@
+import os
+import time
+import bisect
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# Upper bounds in seconds, cooks range from a cached hit to many minutes
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def formatLabels(labels) -> str:
+    if not labels:
+        return ""
+    escaped = ('{}="{}"'.format(name, str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"'))
+               for name, value in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+def formatValue(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+
+    def __init__(self, name, help, labelNames, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelNames = tuple(labelNames)
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labelValues):
+        with self.lock:
+            series = self.series.get(labelValues)
+            if series is None:
+                # one count per bucket plus +Inf, then the sum
+                series = self.series[labelValues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self) -> list:
+        lines = ["# HELP {} {}".format(self.name, self.help), "# TYPE {} histogram".format(self.name)]
+        with self.lock:
+            series = sorted(self.series.items())
+        for labelValues, counts in series:
+            labels = list(zip(self.labelNames, labelValues))
+            total = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                total += count
+                lines.append("{}_bucket{} {}".format(self.name, formatLabels(labels + [("le", formatValue(bound))]),
+                                                     total))
+            lines.append("{}_sum{} {}".format(self.name, formatLabels(labels), formatValue(counts[-1])))
+            lines.append("{}_count{} {}".format(self.name, formatLabels(labels), total))
+        return lines
+
+
+class Registry:
+    # Histograms are recorded as requests run. Everything else is read from
+    # the collectors when /metrics is scraped, a collector returns
+    # (name, type, help, [(labels, value)]) tuples.
+
+    def __init__(self):
+        self.histograms = []
+        self.collectors = []
+
+    def histogram(self, name, help, labelNames, buckets=LATENCY_BUCKETS) -> Histogram:
+        histogram = Histogram(name, help, labelNames, buckets)
+        self.histograms.append(histogram)
+        return histogram
+
+    def collector(self, collect):
+        self.collectors.append(collect)
+        return collect
+
+    def render(self) -> str:
+        lines = []
+        for histogram in self.histograms:
+            lines += histogram.render()
+        for collect in self.collectors:
+            for name, type, help, samples in collect():
+                lines.append("# HELP {} {}".format(name, help))
+                lines.append("# TYPE {} {}".format(name, type))
+                for labels, value in samples:
+                    lines.append("{}{} {}".format(name, formatLabels(labels), formatValue(value)))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+requestSeconds = registry.histogram("harpoon_request_seconds", "Processor request latency until the response is sent",
+                                    ("processor", "asset"))
+stageSeconds = registry.histogram("harpoon_stage_seconds", "Time spent in each stage of a processor request",
+                                  ("processor", "stage"))
+queueSeconds = registry.histogram("harpoon_queue_wait_seconds", "Time cooks waited for a scheduler slot", ("priority",))
+
+# Timings of the most recent requests, served as JSON by /api/timings
+recentTimings = deque(maxlen=256)
+current = threading.local()
+
+
+class RequestTimer:
+    # Collects the stages of one processor request. The timer of the running
+    # request is also kept per thread so that code further down can add
+    # spans with metrics.span without having it passed in.
+
+    def __init__(self, processor, asset):
+        self.processor = processor
+        self.asset = asset
+        self.started = time.time()
+        self.spans = []
+        self.pending = None
+        self.finished = None
+        current.timer = self
+
+    @contextmanager
+    def span(self, stage):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(stage, start, time.time())
+
+    def record(self, stage, start, end):
+        self.spans.append((stage, start - self.started, end - start))
+        stageSeconds.observe(end - start, self.processor, stage)
+
+    def begin(self, stage):
+        # Open a stage that lasts until the request finishes, e.g. sending
+        # the response
+        self.pending = (stage, time.time())
+
+    def finish(self):
+        if self.finished is not None:
+            return
+        self.finished = time.time()
+        if self.pending is not None:
+            self.record(self.pending[0], self.pending[1], self.finished)
+        requestSeconds.observe(self.finished - self.started, self.processor, self.asset)
+        recentTimings.append(self.serialize())
+        if getattr(current, "timer", None) is self:
+            current.timer = None
+
+    def serverTiming(self) -> str:
+        return ", ".join('{};dur={:.1f}'.format(stage, duration * 1000) for stage, _, duration in self.spans)
+
+    def serialize(self) -> dict:
+        return {
+            "processor": self.processor,
+            "asset": self.asset,
+            "started": self.started,
+            "duration": (self.finished or time.time()) - self.started,
+            "spans": [{"stage": stage, "offset": offset, "duration": duration} for stage, offset, duration in self.spans]
+        }
+
+
+def release():
+    # Called when a request context ends, the timer may still be finished
+    # later by whoever sends the response
+    current.timer = None
+
+
+@contextmanager
+def span(stage):
+    # Time a stage of the request running on this thread, if there is one
+    timer = getattr(current, "timer", None)
+    if timer is None:
+        yield
+        return
+    with timer.span(stage):
+        yield
+
+
+def directorySize(path) -> int:
+    size = 0
+    stack = [path]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                else:
+                    size += entry.stat(follow_symlinks=False).st_size
+            except OSError:
+                pass
+    return size
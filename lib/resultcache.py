@@ -0,0 +1,100 @@
+import os
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def linkOrCopy(source, destination):
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+class ResultCache:
+    # Size-bounded, on-disk LRU store of response zips keyed by a content hash
+    # of the asset, the normalized form and the uploaded files.
+
+    def __init__(self, directory, maxBytes):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.entries = OrderedDict()
+        self.totalBytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.load()
+
+    def load(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".zip"):
+                continue
+            stat = os.stat(os.path.join(self.directory, name))
+            files.append((stat.st_mtime, name[:-4], stat.st_size))
+        for mtime, key, size in sorted(files):
+            self.entries[key] = size
+            self.totalBytes += size
+        self.evict()
+
+    @staticmethod
+    def key(*parts) -> str:
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(str(part).encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def path(self, key) -> str:
+        return os.path.abspath(os.path.join(self.directory, key + ".zip"))
+
+    def fetch(self, key, destination) -> bool:
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return False
+            self.entries.move_to_end(key)
+            self.hits += 1
+            path = self.path(key)
+            # mtime keeps the LRU order across restarts
+            os.utime(path)
+            linkOrCopy(path, destination)
+        return True
+
+    def put(self, key, source):
+        path = self.path(key)
+        tempPath = path + ".tmp"
+        linkOrCopy(source, tempPath)
+        os.replace(tempPath, path)
+        size = os.path.getsize(path)
+        with self.lock:
+            self.totalBytes += size - self.entries.get(key, 0)
+            self.entries[key] = size
+            self.entries.move_to_end(key)
+            self.evict()
+
+    def evict(self):
+        while self.totalBytes > self.maxBytes and self.entries:
+            key, size = self.entries.popitem(last=False)
+            self.totalBytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "bytes": self.totalBytes,
+                "maxBytes": self.maxBytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hitRate": self.hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,124 @@
+import math
+import threading
+from collections import OrderedDict, deque
+
+# Highest first
+PRIORITIES = ("interactive", "batch")
+
+
+class SchedulerFull(Exception):
+
+    def __init__(self, message, retryAfter):
+        super().__init__(message)
+        self.retryAfter = retryAfter
+
+
+class SchedulerCancelled(Exception):
+    pass
+
+
+class Scheduler:
+    # Hands out a fixed number of cook slots. A freed slot goes to the highest
+    # priority class with someone waiting, within a class the waiting clients
+    # take turns so one client queueing many cooks does not hold up the rest.
+
+    POLL_INTERVAL = 0.25
+
+    def __init__(self, slots, maxQueued=64, priorities=PRIORITIES):
+        self.slots = slots
+        self.maxQueued = maxQueued
+        self.priorities = priorities
+        self.running = 0
+        self.queued = 0
+        # priority -> client -> deque of waiting events, clients in turn order
+        self.queues = {priority: OrderedDict() for priority in priorities}
+        self.admitted = dict.fromkeys(priorities, 0)
+        self.rejected = dict.fromkeys(priorities, 0)
+        # moving average of how long a slot is held, for Retry-After
+        self.holdSeconds = 1.0
+        self.lock = threading.Lock()
+
+    def acquire(self, priority, client, admit=True, cancelEvent=None):
+        # Blocks until a slot is free. With admit, raises SchedulerFull instead
+        # of queueing once maxQueued cooks of the same or a higher priority are
+        # waiting, lower priorities never keep a request out. Setting
+        # cancelEvent gives up the place in the queue.
+        with self.lock:
+            if self.running < self.slots and self.queued == 0:
+                self.running += 1
+                self.admitted[priority] += 1
+                return
+            ahead = self.ahead(priority)
+            if admit and ahead >= self.maxQueued:
+                self.rejected[priority] += 1
+                raise SchedulerFull("{} cooks already queued".format(ahead), self.retryAfter(ahead))
+            granted = threading.Event()
+            self.queues[priority].setdefault(client, deque()).append(granted)
+            self.queued += 1
+            self.admitted[priority] += 1
+        while not granted.wait(self.POLL_INTERVAL if cancelEvent is not None else None):
+            if cancelEvent.is_set() and self.withdraw(priority, client, granted):
+                raise SchedulerCancelled("Cancelled while waiting for a slot")
+
+    def withdraw(self, priority, client, granted) -> bool:
+        # False if the slot was granted in the meantime
+        with self.lock:
+            waiting = self.queues[priority].get(client)
+            if waiting is None or granted not in waiting:
+                return False
+            waiting.remove(granted)
+            if not waiting:
+                del self.queues[priority][client]
+            self.queued -= 1
+            return True
+
+    def release(self, heldSeconds):
+        with self.lock:
+            self.holdSeconds = 0.8 * self.holdSeconds + 0.2 * heldSeconds
+            granted = self.next()
+            if granted is None:
+                self.running -= 1
+            else:
+                # the slot passes straight to the next waiter
+                self.queued -= 1
+                granted.set()
+
+    def next(self):
+        for priority in self.priorities:
+            queue = self.queues[priority]
+            if not queue:
+                continue
+            client, waiting = next(iter(queue.items()))
+            granted = waiting.popleft()
+            if waiting:
+                queue.move_to_end(client)
+            else:
+                del queue[client]
+            return granted
+        return None
+
+    def ahead(self, priority) -> int:
+        # Cooks that would get a slot before a new one of this priority
+        count = 0
+        for other in self.priorities:
+            count += sum(len(waiting) for waiting in self.queues[other].values())
+            if other == priority:
+                return count
+        return count
+
+    def retryAfter(self, ahead) -> int:
+        return max(1, math.ceil(self.holdSeconds * (ahead + 1) / self.slots))
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "slots": self.slots,
+                "running": self.running,
+                "queued": {priority: sum(len(waiting) for waiting in self.queues[priority].values())
+                           for priority in self.priorities},
+                "clients": {priority: len(self.queues[priority]) for priority in self.priorities},
+                "maxQueued": self.maxQueued,
+                "admitted": dict(self.admitted),
+                "rejected": dict(self.rejected),
+                "holdSeconds": self.holdSeconds
+            }
@@ -1,6 +1,6 @@
 from __future__ import annotations
 from typing import Dict, Any
-import hou
+from lib.lazyimport import hou
 import json
 from xml.etree import ElementTree
 from enum import Enum
@@ -28,31 +28,49 @@ class ParmTemplateType(Enum):
     Label = "Label"
     Ramp = "Ramp"
 
+def toJson(table) -> bytes:
+    # Same bytes as flask.jsonify outside of debug mode (harpoon turns off
+    # JSON_SORT_KEYS), encoded once so they can be cached
+    return (json.dumps(table, separators=(",", ":")) + "\n").encode()
+
 class ParmTemplate:
-    name: str
-    label: str
-    type: str
-    dataType: str
-    numComponents: int
-    look = ""
-    help = ""
-    isHidden = False
-    isLabelHidden = False
-    joinsWithNext = False
+    # Templates are built once by the From* factories and not modified
+    # afterwards, so their serialized form is computed on first use and kept.
+    __slots__ = ("name", "label", "type", "dataType", "numComponents", "look", "help",
+                 "isHidden", "isLabelHidden", "joinsWithNext", "_serialized")
+    # (key, attribute) pairs in wire order
+    serializedFields = (
+        ("name", "name"),
+        ("label", "label"),
+        ("type", "type"),
+        ("dataType", "dataType"),
+        ("numComponents", "numComponents"),
+        ("look", "look"),
+        ("help", "help"),
+        ("isHidden", "isHidden"),
+        ("isLabelHidden", "isLabelHidden"),
+        ("joinsWithNext", "joinsWithNext")
+    )
+
+    def __init__(self):
+        self.look = ""
+        self.help = ""
+        self.isHidden = False
+        self.isLabelHidden = False
+        self.joinsWithNext = False
+        self._serialized = None
 
     def serialize(self) -> dict:
-        return {
-            "name": self.name,
-            "label": self.label,
-            "type": self.type,
-            "dataType": self.dataType,
-            "numComponents": self.numComponents,
-            "look": self.look,
-            "help": self.help,
-            "isHidden": self.isHidden,
-            "isLabelHidden": self.isLabelHidden,
-            "joinsWithNext": self.joinsWithNext
-        }
+        if self._serialized is None:
+            self._serialized = self._serialize()
+        return self._serialized
+
+    def _serialize(self) -> dict:
+        return {key: getattr(self, attribute) for key, attribute in self.serializedFields}
+
+    def serializeToDepth(self, depth) -> dict:
+        # Only folders have anything to collapse
+        return self.serialize()
 
     @classmethod
     def _FromHouParmTemplate(cls, houParmTemplate: hou.ParmTemplate) -> ParmTemplate:
@@ -102,24 +120,23 @@ class ParmTemplate:
         return parmTemplate
 
 class IntParmTemplate(ParmTemplate):
-    defaultValue: []
-    minValue: int
-    maxValue: int
-    minIsStrict = False
-    maxIsStrict = False
-    menuItems = []
-    menuLabels = []
-
-    def serialize(self) -> dict:
-        table = ParmTemplate.serialize(self)
-        table["defaultValue"] = self.defaultValue
-        table["minValue"] = self.minValue
-        table["maxValue"] = self.maxValue
-        table["minIsStrict"] = self.minIsStrict
-        table["maxIsStrict"] = self.maxIsStrict
-        table["menuItems"] = self.menuItems
-        table["menuLabels"] = self.menuLabels
-        return table
+    __slots__ = ("defaultValue", "minValue", "maxValue", "minIsStrict", "maxIsStrict", "menuItems", "menuLabels")
+    serializedFields = ParmTemplate.serializedFields + (
+        ("defaultValue", "defaultValue"),
+        ("minValue", "minValue"),
+        ("maxValue", "maxValue"),
+        ("minIsStrict", "minIsStrict"),
+        ("maxIsStrict", "maxIsStrict"),
+        ("menuItems", "menuItems"),
+        ("menuLabels", "menuLabels")
+    )
+
+    def __init__(self):
+        super().__init__()
+        self.minIsStrict = False
+        self.maxIsStrict = False
+        self.menuItems = []
+        self.menuLabels = []
 
     @classmethod
     def FromHouIntParmTemplate(cls, houIntParmTemplate: hou.IntParmTemplate) -> IntParmTemplate:
@@ -147,20 +164,19 @@ class IntParmTemplate(ParmTemplate):
         return intParmTemplate
 
 class FloatParmTemplate(ParmTemplate):
-    defaultValue: []
-    minValue: float
-    maxValue: float
-    minIsStrict = False
-    maxIsStrict = False
-
-    def serialize(self) -> dict:
-        table = ParmTemplate.serialize(self)
-        table["defaultValue"] = self.defaultValue
-        table["minValue"] = self.minValue
-        table["maxValue"] = self.maxValue
-        table["minIsStrict"] = self.minIsStrict
-        table["maxIsStrict"] = self.maxIsStrict
-        return table
+    __slots__ = ("defaultValue", "minValue", "maxValue", "minIsStrict", "maxIsStrict")
+    serializedFields = ParmTemplate.serializedFields + (
+        ("defaultValue", "defaultValue"),
+        ("minValue", "minValue"),
+        ("maxValue", "maxValue"),
+        ("minIsStrict", "minIsStrict"),
+        ("maxIsStrict", "maxIsStrict")
+    )
+
+    def __init__(self):
+        super().__init__()
+        self.minIsStrict = False
+        self.maxIsStrict = False
 
     @classmethod
     def FromHouFloatParmTemplate(cls, houFloatParmTemplate: hou.FloatParmTemplate) -> FloatParmTemplate:
@@ -183,20 +199,20 @@ class FloatParmTemplate(ParmTemplate):
         return floatParmTemplate
 
 class StringParmTemplate(ParmTemplate):
-    defaultValue: []
-    stringType: str
-    fileType = ""
-    menuItems = []
-    menuLabels = []
-
-    def serialize(self) -> dict:
-        table = ParmTemplate.serialize(self)
-        table["defaultValue"] = self.defaultValue
-        table["stringType"] = self.stringType
-        table["fileType"] = self.fileType
-        table["menuItems"] = self.menuItems
-        table["menuLabels"] = self.menuLabels
-        return table
+    __slots__ = ("defaultValue", "stringType", "fileType", "menuItems", "menuLabels")
+    serializedFields = ParmTemplate.serializedFields + (
+        ("defaultValue", "defaultValue"),
+        ("stringType", "stringType"),
+        ("fileType", "fileType"),
+        ("menuItems", "menuItems"),
+        ("menuLabels", "menuLabels")
+    )
+
+    def __init__(self):
+        super().__init__()
+        self.fileType = ""
+        self.menuItems = []
+        self.menuLabels = []
 
     @classmethod
     def FromHouStringParmTemplate(cls, houStringParmTemplate: hou.StringParmTemplate) -> StringParmTemplate:
@@ -219,12 +235,10 @@ class StringParmTemplate(ParmTemplate):
         return stringParmTemplate
 
 class ToggleParmTemplate(ParmTemplate):
-    defaultValue: []
-
-    def serialize(self) -> dict:
-        table = ParmTemplate.serialize(self)
-        table["defaultValue"] = self.defaultValue
-        return table
+    __slots__ = ("defaultValue",)
+    serializedFields = ParmTemplate.serializedFields + (
+        ("defaultValue", "defaultValue"),
+    )
 
     @classmethod
     def FromHouToggleParmTemplate(cls, houToggleParmTemplate: hou.ToggleParmTemplate) -> ToggleParmTemplate:
@@ -239,26 +253,19 @@ class ToggleParmTemplate(ParmTemplate):
         return toggleParmTemplate
 
 class MenuParmTemplate(ParmTemplate):
-    defaultValue: []
-    defaultValueAsString: bool
-    menuItems: []
-    menuLabels: []
-    menuType: str
-    isMenu: bool
-    isButtonStrip: bool
-    isIconStrip: bool
-
-    def serialize(self) -> dict:
-        table = ParmTemplate.serialize(self)
-        table["defaultValue"] = self.defaultValue
-        table["defaultValueAsString"] = self.defaultValueAsString
-        table["menuItems"] = self.menuItems
-        table["menuLabels"] = self.menuLabels
-        table["menuType"] = self.menuType
-        table["isMenu"] = self.isMenu
-        table["isButtonStrip"] = self.isButtonStrip
-        table["isIconStrip"] = self.isButtonStrip
-        return table
+    __slots__ = ("defaultValue", "defaultValueAsString", "menuItems", "menuLabels", "menuType",
+                 "isMenu", "isButtonStrip", "isIconStrip")
+    serializedFields = ParmTemplate.serializedFields + (
+        ("defaultValue", "defaultValue"),
+        ("defaultValueAsString", "defaultValueAsString"),
+        ("menuItems", "menuItems"),
+        ("menuLabels", "menuLabels"),
+        ("menuType", "menuType"),
+        ("isMenu", "isMenu"),
+        ("isButtonStrip", "isButtonStrip"),
+        # clients already read isIconStrip from isButtonStrip
+        ("isIconStrip", "isButtonStrip")
+    )
 
     @classmethod
     def FromHouMenuParmTemplate(cls, houMenuParmTemplate: hou.MenuParmTemplate) -> MenuParmTemplate:
@@ -273,25 +280,155 @@ class MenuParmTemplate(ParmTemplate):
         menuParmTemplate.isIconStrip = houMenuParmTemplate.isIconStrip()
         return menuParmTemplate
 
+class FolderParmTemplate(ParmTemplate):
+    # Folders and multiparm blocks. Their contents are serialized recursively,
+    # serializeToDepth leaves out everything below a given depth so that clients
+    # can expand large hierarchies lazily.
+    __slots__ = ("folderType", "defaultValue", "isActualFolder", "endsTabGroup", "parmTemplates")
+    serializedFields = ParmTemplate.serializedFields + (
+        ("folderType", "folderType"),
+        ("defaultValue", "defaultValue"),
+        ("isActualFolder", "isActualFolder"),
+        ("endsTabGroup", "endsTabGroup")
+    )
+
+    def __init__(self):
+        super().__init__()
+        self.parmTemplates = []
+
+    def _serialize(self) -> dict:
+        table = ParmTemplate._serialize(self)
+        table["numParmTemplates"] = len(self.parmTemplates)
+        table["parmTemplates"] = [parmTemplate.serialize() for parmTemplate in self.parmTemplates]
+        return table
+
+    def serializeToDepth(self, depth) -> dict:
+        if depth is None:
+            return self.serialize()
+        table = ParmTemplate._serialize(self)
+        table["numParmTemplates"] = len(self.parmTemplates)
+        if depth > 0:
+            table["parmTemplates"] = [parmTemplate.serializeToDepth(depth - 1) for parmTemplate in self.parmTemplates]
+        else:
+            table["parmTemplates"] = None
+        return table
+
+    @classmethod
+    def FromHouFolderParmTemplate(cls, houFolderParmTemplate: hou.FolderParmTemplate) -> FolderParmTemplate:
+        folderParmTemplate: FolderParmTemplate = FolderParmTemplate._FromHouParmTemplate(houFolderParmTemplate)
+        folderParmTemplate.folderType = str(houFolderParmTemplate.folderType()).split(".")[1]
+        folderParmTemplate.defaultValue = houFolderParmTemplate.defaultValue()
+        folderParmTemplate.isActualFolder = houFolderParmTemplate.isActualFolder()
+        folderParmTemplate.endsTabGroup = houFolderParmTemplate.endsTabGroup()
+        folderParmTemplate.parmTemplates = ParmTemplateGroup.FromHouParmTemplates(houFolderParmTemplate.parmTemplates())
+        return folderParmTemplate
+
+class FolderSetParmTemplate(ParmTemplate):
+    __slots__ = ("folderNames", "folderType")
+    serializedFields = ParmTemplate.serializedFields + (
+        ("folderNames", "folderNames"),
+        ("folderType", "folderType")
+    )
+
+    @classmethod
+    def FromHouFolderSetParmTemplate(cls, houFolderSetParmTemplate: hou.FolderSetParmTemplate) -> FolderSetParmTemplate:
+        folderSetParmTemplate: FolderSetParmTemplate = FolderSetParmTemplate._FromHouParmTemplate(houFolderSetParmTemplate)
+        folderSetParmTemplate.folderNames = list(houFolderSetParmTemplate.folderNames())
+        folderSetParmTemplate.folderType = str(houFolderSetParmTemplate.folderType()).split(".")[1]
+        return folderSetParmTemplate
+
+class RampParmTemplate(ParmTemplate):
+    __slots__ = ("defaultValue", "rampParmType", "defaultBasis", "showsControls")
+    serializedFields = ParmTemplate.serializedFields + (
+        ("defaultValue", "defaultValue"),
+        ("rampParmType", "rampParmType"),
+        ("defaultBasis", "defaultBasis"),
+        ("showsControls", "showsControls")
+    )
+
+    @classmethod
+    def FromHouRampParmTemplate(cls, houRampParmTemplate: hou.RampParmTemplate) -> RampParmTemplate:
+        rampParmTemplate: RampParmTemplate = RampParmTemplate._FromHouParmTemplate(houRampParmTemplate)
+        rampParmTemplate.defaultValue = houRampParmTemplate.defaultValue()
+        rampParmTemplate.rampParmType = str(houRampParmTemplate.rampParmType()).split(".")[1]
+        rampParmTemplate.defaultBasis = str(houRampParmTemplate.defaultBasis()).split(".")[-1]
+        rampParmTemplate.showsControls = houRampParmTemplate.showsControls()
+        return rampParmTemplate
+
+class LabelParmTemplate(ParmTemplate):
+    __slots__ = ("columnLabels",)
+    serializedFields = ParmTemplate.serializedFields + (
+        ("columnLabels", "columnLabels"),
+    )
+
+    @classmethod
+    def FromHouLabelParmTemplate(cls, houLabelParmTemplate: hou.LabelParmTemplate) -> LabelParmTemplate:
+        labelParmTemplate: LabelParmTemplate = LabelParmTemplate._FromHouParmTemplate(houLabelParmTemplate)
+        labelParmTemplate.columnLabels = list(houLabelParmTemplate.columnLabels())
+        return labelParmTemplate
+
 class ParmTemplateGroup:
-    name = ""
-    label = ""
-    parmTemplates = [ParmTemplate]
+    __slots__ = ("name", "label", "parmTemplates", "_serialized", "_json")
+
+    def __init__(self):
+        self.name = ""
+        self.label = ""
+        self.parmTemplates = []
+        self._serialized = None
+        self._json = None
 
     def serialize(self) -> dict:
-        parmTemplates = []
-        for parmTemplate in self.parmTemplates:
-            parmTemplates.append(parmTemplate.serialize())
+        if self._serialized is None:
+            self._serialized = {
+                "name": self.name,
+                "label": self.label,
+                "parmTemplates": [parmTemplate.serialize() for parmTemplate in self.parmTemplates]
+            }
+        return self._serialized
+
+    def toJson(self) -> bytes:
+        if self._json is None:
+            self._json = toJson(self.serialize())
+        return self._json
+
+    def find(self, path) -> ParmTemplateGroup:
+        # Return the folder at a "/" separated path of folder names as a group
+        group = self
+        for name in [name for name in path.split("/") if name]:
+            folder = next((parmTemplate for parmTemplate in group.parmTemplates
+                           if isinstance(parmTemplate, FolderParmTemplate) and parmTemplate.name == name), None)
+            if folder is None:
+                raise KeyError("No folder {} in {}".format(name, path))
+            group = ParmTemplateGroup()
+            group.name = folder.name
+            group.label = folder.label
+            group.parmTemplates = folder.parmTemplates
+        return group
+
+    def view(self, path="", depth=None, offset=0, limit=None) -> dict:
+        group = self.find(path)
+        end = None if limit is None else offset + limit
         return {
-            "name": self.name,
-            "label": self.label,
-            "parmTemplates": parmTemplates
+            "name": group.name,
+            "label": group.label,
+            "path": path,
+            "offset": offset,
+            "numParmTemplates": len(group.parmTemplates),
+            "parmTemplates": [parmTemplate.serializeToDepth(depth) for parmTemplate in group.parmTemplates[offset:end]]
         }
 
     @classmethod
     def FromHouParmTemplateGroup(cls, houParmTemplateGroup: hou.ParmTemplateGroup) -> ParmTemplateGroup:
+        parmTemplateGroup = cls()
+        parmTemplateGroup.name = houParmTemplateGroup.name()
+        parmTemplateGroup.label = houParmTemplateGroup.label()
+        parmTemplateGroup.parmTemplates = cls.FromHouParmTemplates(houParmTemplateGroup.entries())
+        return parmTemplateGroup
+
+    @classmethod
+    def FromHouParmTemplates(cls, houParmTemplates) -> list:
         parmTemplates = []
-        for houParmTemplate in houParmTemplateGroup.entries():
+        for houParmTemplate in houParmTemplates:
             type = houParmTemplate.type()
             parmTemplate = None
             if type == hou.parmTemplateType.Int:
@@ -304,15 +441,21 @@ class ParmTemplateGroup:
                 parmTemplate = ToggleParmTemplate.FromHouToggleParmTemplate(houParmTemplate)
             elif type == hou.parmTemplateType.Menu:
                 parmTemplate = MenuParmTemplate.FromHouMenuParmTemplate(houParmTemplate)
+            elif type == hou.parmTemplateType.Folder:
+                parmTemplate = FolderParmTemplate.FromHouFolderParmTemplate(houParmTemplate)
+            elif type == hou.parmTemplateType.FolderSet:
+                parmTemplate = FolderSetParmTemplate.FromHouFolderSetParmTemplate(houParmTemplate)
+            elif type == hou.parmTemplateType.Ramp:
+                parmTemplate = RampParmTemplate.FromHouRampParmTemplate(houParmTemplate)
+            elif type == hou.parmTemplateType.Label:
+                parmTemplate = LabelParmTemplate.FromHouLabelParmTemplate(houParmTemplate)
+            elif type in (hou.parmTemplateType.Button, hou.parmTemplateType.Separator):
+                parmTemplate = ParmTemplate._FromHouParmTemplate(houParmTemplate)
             if parmTemplate is None:
                 print(type)
             else:
                 parmTemplates.append(parmTemplate)
-        parmTemplateGroup = cls()
-        parmTemplateGroup.name = houParmTemplateGroup.name()
-        parmTemplateGroup.label = houParmTemplateGroup.label()
-        parmTemplateGroup.parmTemplates = parmTemplates
-        return parmTemplateGroup
+        return parmTemplates
 
     @classmethod
     def FromTorNodeMap(cls, torNodeMap: ElementTree) -> ParmTemplateGroup:
@@ -334,7 +477,26 @@ class ParmTemplateGroup:
         parmTemplateGroup.parmTemplates = parmTemplates
         return parmTemplateGroup
 
+def parseParmTemplateQuery(args):
+    # Read the subtree and paging settings of a parameter listing from its
+    # query string. Returns None when the whole tree is requested.
+    if not any(name in args for name in ("path", "depth", "offset", "limit")):
+        return None
+    query = {"path": args.get("path", "")}
+    for name in ("depth", "offset", "limit"):
+        value = args.get(name)
+        if value is not None:
+            value = int(value)
+            if value < 0:
+                raise ValueError("{} must not be negative".format(name))
+        query[name] = value
+    query["offset"] = query["offset"] or 0
+    return query
+
 class HDADefinition:
+    __slots__ = ("nodeType", "nodeTypeCategory", "nodeTypeName", "libraryFilePath", "isInstalled", "version",
+                 "comment", "description", "icon", "modificationTime", "embeddedHelp", "userInfo", "extraInfo",
+                 "minNumInputs", "maxNumInputs", "maxNumOutputs", "parmTemplateGroup", "_serialized", "_json")
     nodeType: str
     nodeTypeCategory: str
     nodeTypeName: str
@@ -354,6 +516,16 @@ class HDADefinition:
     parmTemplateGroup: ParmTemplateGroup
 
     def serialize(self) -> dict:
+        if self._serialized is None:
+            self._serialized = self._serialize()
+        return self._serialized
+
+    def toJson(self) -> bytes:
+        if self._json is None:
+            self._json = toJson(self.serialize())
+        return self._json
+
+    def _serialize(self) -> dict:
         return {
             "nodeType": self.nodeType,
             "nodeTypeCategory": self.nodeTypeCategory,
@@ -392,6 +564,8 @@ class HDADefinition:
         self.maxNumInputs = definition.maxNumInputs()
         self.maxNumOutputs = definition.maxNumOutputs()
         self.parmTemplateGroup = ParmTemplateGroup.FromHouParmTemplateGroup(definition.parmTemplateGroup())
+        self._serialized = None
+        self._json = None
 
 def nodeToJson(node: hou.Node):
     return {
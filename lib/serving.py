@@ -0,0 +1,89 @@
+import sys
+import time
+import signal
+import _thread
+import threading
+from werkzeug.wsgi import ClosingIterator
+
+
+class Drain:
+    # WSGI middleware that counts requests until their response has been
+    # sent. Once draining, new requests are turned away with a 503 while the
+    # ones in flight finish.
+
+    def __init__(self, app, retryAfter=30):
+        self.app = app
+        self.retryAfter = retryAfter
+        self.active = 0
+        self.draining = False
+        self.changed = threading.Condition()
+
+    def __call__(self, environ, start_response):
+        with self.changed:
+            if self.draining:
+                start_response("503 Service Unavailable", [("Content-Type", "application/json"),
+                                                           ("Retry-After", str(self.retryAfter))])
+                return [b'{"error": "Server is shutting down"}\n']
+            self.active += 1
+        try:
+            response = self.app(environ, start_response)
+        except BaseException:
+            self.leave()
+            raise
+        return ClosingIterator(response, self.leave)
+
+    def leave(self):
+        with self.changed:
+            self.active -= 1
+            self.changed.notify_all()
+
+    def drain(self, timeout=None) -> bool:
+        with self.changed:
+            self.draining = True
+            return self.changed.wait_for(lambda: self.active == 0, timeout)
+
+
+def serve(app, host, port, threads=16, backlog=64, drainTimeout=300, jobManager=None, onExit=None):
+    # Serve app with waitress until SIGINT/SIGTERM, then drain requests and
+    # jobs for at most drainTimeout seconds before returning. A second signal
+    # exits right away.
+    try:
+        import waitress
+    except ImportError:
+        sys.exit("Production mode needs waitress: pip install waitress")
+    drain = Drain(app)
+    # backlog connections may wait for one of the threads, the kernel queues
+    # as many again before refusing
+    server = waitress.create_server(drain, host=host, port=port, threads=threads, backlog=backlog,
+                                    connection_limit=threads + backlog, ident="harpoon")
+    stopping = threading.Event()
+    drained = threading.Event()
+
+    def shutdown():
+        deadline = time.time() + drainTimeout
+        print("Draining {} requests".format(drain.active))
+        complete = drain.drain(drainTimeout)
+        if jobManager is not None:
+            complete = jobManager.drain(max(0.0, deadline - time.time())) and complete
+        if not complete:
+            print("Drain timed out after {}s".format(drainTimeout))
+        drained.set()
+        # wake the main thread, waitress stops on KeyboardInterrupt
+        _thread.interrupt_main()
+
+    def onSignal(signum, frame):
+        if drained.is_set():
+            raise KeyboardInterrupt()
+        if stopping.is_set():
+            print("Exiting without draining")
+            raise KeyboardInterrupt()
+        stopping.set()
+        threading.Thread(target=shutdown, name="harpoon-drain", daemon=True).start()
+
+    signal.signal(signal.SIGINT, onSignal)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, onSignal)
+    print("Serving on http://{}:{} with {} threads".format(host, port, threads))
+    server.run()
+    if onExit is not None:
+        onExit()
@@ -0,0 +1,96 @@
+import threading
+from lib.resultcache import linkOrCopy
+
+
+class Follower:
+    __slots__ = ("outputFiles", "error")
+
+    def __init__(self, outputFiles):
+        self.outputFiles = outputFiles
+        # set if its copy of the outputs failed
+        self.error = None
+
+
+class Flight:
+    __slots__ = ("outputCount", "done", "error", "abandoned", "followers")
+
+    def __init__(self, outputCount):
+        self.outputCount = outputCount
+        self.done = threading.Event()
+        self.error = None
+        # the leader gave up for its own reasons, followers cook themselves
+        self.abandoned = False
+        self.followers = []
+
+
+class SingleFlight:
+    # Runs one cook per key at a time. Callers arriving with the same key
+    # while it runs wait for it and get links to its output files instead of
+    # cooking again. Errors in unshared, such as the leader being cancelled,
+    # are not passed on; its followers start over instead.
+
+    def __init__(self, unshared=()):
+        self.unshared = unshared
+        self.flights = {}
+        self.cooks = 0
+        self.saved = 0
+        self.lock = threading.Lock()
+
+    def run(self, key, outputFiles, cook) -> bool:
+        # cook writes outputFiles, a follower gets them at its own
+        # outputFiles in the same order. Returns False for followers.
+        while True:
+            with self.lock:
+                flight = self.flights.get(key)
+                if flight is None:
+                    flight = self.flights[key] = Flight(len(outputFiles))
+                    self.cooks += 1
+                    break
+                if len(outputFiles) != flight.outputCount:
+                    raise ValueError("{} output files for a flight with {}".format(len(outputFiles), flight.outputCount))
+                follower = Follower(outputFiles)
+                flight.followers.append(follower)
+            flight.done.wait()
+            if flight.abandoned:
+                continue
+            if flight.error is not None:
+                raise flight.error
+            if follower.error is not None:
+                raise follower.error
+            return False
+        try:
+            cook()
+            with self.lock:
+                # later callers start a new flight
+                del self.flights[key]
+            for follower in flight.followers:
+                try:
+                    for source, destination in zip(outputFiles, follower.outputFiles):
+                        linkOrCopy(source, destination)
+                except Exception as e:
+                    # only that follower fails, say its workspace is gone
+                    follower.error = e
+                    continue
+                with self.lock:
+                    self.saved += 1
+        except self.unshared:
+            flight.abandoned = True
+            raise
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                if self.flights.get(key) is flight:
+                    del self.flights[key]
+            flight.done.set()
+        return True
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "inFlight": len(self.flights),
+                "waiting": sum(len(flight.followers) for flight in self.flights.values()),
+                "cooks": self.cooks,
+                "saved": self.saved
+            }
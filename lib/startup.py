@@ -0,0 +1,63 @@
+import time
+import threading
+import traceback
+from contextlib import contextmanager
+
+
+class Startup:
+    # How far a starting server got. The port is bound before the warm-up
+    # steps run, /health reports "warming" and /ready fails until they are
+    # done.
+
+    def __init__(self, started=None):
+        self.started = started or time.time()
+        self.phases = []
+        self.ready = threading.Event()
+        self.error = None
+
+    @contextmanager
+    def phase(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.time() - start))
+
+    def mark(self, name):
+        # A phase that ran from the start of the process until now
+        self.phases.append((name, time.time() - self.started))
+
+    def run(self, steps):
+        # Run the (name, step) warm-up steps in order on a background thread
+        def warmUp():
+            try:
+                for name, step in steps:
+                    with self.phase(name):
+                        step()
+            except Exception as e:
+                traceback.print_exc()
+                self.error = str(e)
+                return
+            self.finish()
+        thread = threading.Thread(target=warmUp, name="harpoon-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def finish(self):
+        self.mark("ready")
+        self.ready.set()
+        print("Ready after {:.1f}s ({})".format(time.time() - self.started, ", ".join(
+            "{} {:.1f}s".format(name, seconds) for name, seconds in self.phases)))
+
+    def status(self) -> str:
+        if self.error is not None:
+            return "failed"
+        return "ready" if self.ready.is_set() else "warming"
+
+    def serialize(self) -> dict:
+        return {
+            "status": self.status(),
+            "uptime": time.time() - self.started,
+            "startup": {name: seconds for name, seconds in self.phases},
+            "error": self.error
+        }
@@ -0,0 +1,147 @@
+import threading
+from contextlib import contextmanager
+from lib.lazyimport import hou
+from lib import metrics
+
+
+class TopNetTemplate:
+    # A topnet wrapping one HDA node with the partitionbyexpression/filecompress
+    # chain. It is built once per node type and reused by every cook, only the
+    # parameters touched by the previous request are reverted in between.
+
+    def __init__(self, hda):
+        self.nodeTypeName = hda.nodeTypeName()
+        self.topnet = hou.node("/tasks").createNode("topnet")
+        self.topNode = self.topnet.createNode(self.nodeTypeName)
+        self.partition = self.topnet.createNode("partitionbyexpression")
+        self.partition.setFirstInput(self.topNode)
+        self.fileCompress = self.topnet.createNode("filecompress")
+        self.fileCompress.setFirstInput(self.partition)
+        self.touchedParms = []
+        # set once the scene holding the topnet has been replaced
+        self.discarded = False
+        self.lock = threading.Lock()
+
+    def reset(self):
+        for name in self.touchedParms:
+            parmTuple = self.topNode.parmTuple(name)
+            if parmTuple is not None:
+                parmTuple.revertToDefaults()
+        self.touchedParms = []
+
+    def touch(self, names):
+        self.touchedParms.extend(names)
+
+    def destroy(self):
+        self.topnet.destroy()
+
+
+class SceneLock:
+    # Anything building or cooking nodes under /tasks holds it shared, a
+    # scene load holds it exclusive. A waiting load keeps new cooks out so
+    # it is not starved.
+
+    def __init__(self):
+        self.cooking = 0
+        self.loading = False
+        self.loadsWaiting = 0
+        self.changed = threading.Condition()
+
+    @contextmanager
+    def shared(self):
+        with self.changed:
+            while self.loading or self.loadsWaiting:
+                self.changed.wait()
+            self.cooking += 1
+        try:
+            yield
+        finally:
+            with self.changed:
+                self.cooking -= 1
+                if self.cooking == 0:
+                    self.changed.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        with self.changed:
+            self.loadsWaiting += 1
+            while self.loading or self.cooking:
+                self.changed.wait()
+            self.loadsWaiting -= 1
+            self.loading = True
+        try:
+            yield
+        finally:
+            with self.changed:
+                self.loading = False
+                self.changed.notify_all()
+
+
+scene = SceneLock()
+templates = {}
+templatesLock = threading.Lock()
+templatesChanged = threading.Condition(templatesLock)
+# node types whose definition is being reloaded, no template is built for them
+reloading = set()
+
+
+def acquire(hda) -> TopNetTemplate:
+    nodeTypeName = hda.nodeTypeName()
+    with templatesChanged:
+        while nodeTypeName in reloading:
+            templatesChanged.wait()
+        template = templates.get(nodeTypeName)
+        if template is None:
+            with metrics.span("topnet"):
+                template = TopNetTemplate(hda)
+            templates[nodeTypeName] = template
+    return template
+
+
+@contextmanager
+def locked(hda):
+    # The template for hda with its lock held, rebuilt if a reload
+    # discarded it while waiting for the lock
+    with scene.shared():
+        while True:
+            template = acquire(hda)
+            with template.lock:
+                if not template.discarded:
+                    yield template
+                    return
+
+
+def replaceScene(load):
+    # Run load, which replaces the whole scene, once nothing under /tasks is
+    # cooking. The templates' nodes go away with the old scene.
+    with scene.exclusive():
+        try:
+            load()
+        finally:
+            with templatesLock:
+                for template in templates.values():
+                    template.discarded = True
+                templates.clear()
+
+
+def reloadDefinition(nodeTypeName, reload):
+    # Run reload, which redefines the node type, once its topnet is not
+    # cooking. Cooks of the type wait for it and then rebuild the template.
+    with scene.shared():
+        with templatesChanged:
+            while nodeTypeName in reloading:
+                templatesChanged.wait()
+            reloading.add(nodeTypeName)
+            template = templates.pop(nodeTypeName, None)
+        try:
+            if template is None:
+                reload()
+            else:
+                with template.lock:
+                    template.discarded = True
+                    reload()
+                template.destroy()
+        finally:
+            with templatesChanged:
+                reloading.discard(nodeTypeName)
+                templatesChanged.notify_all()
@@ -0,0 +1,179 @@
+import re
+import json
+from lib.serializer import ParmTemplate, FolderParmTemplate, ParmTemplateGroup
+
+MULTIPARM_FOLDER_TYPES = ("MultiparmBlock", "ScrollingMultiparmBlock", "TabbedMultiparmBlock")
+
+
+class ValidationError(ValueError):
+
+    def __init__(self, errors):
+        super().__init__("Invalid parameters: {}".format(", ".join(sorted(errors))))
+        self.errors = errors
+
+    def serialize(self) -> dict:
+        return {
+            "error": str(self),
+            "parms": self.errors
+        }
+
+
+class ParmValidator:
+    # Checks and coerces processor form values against a ParmTemplateGroup
+    # before any node is touched. Multiparm instances ("pt#" -> "pt3") are
+    # matched by pattern.
+
+    def __init__(self, parmTemplateGroup: ParmTemplateGroup):
+        self.parmTemplates = {}
+        self.multiparmTemplates = []
+        self.index(parmTemplateGroup.parmTemplates)
+
+    def index(self, parmTemplates):
+        for parmTemplate in parmTemplates:
+            if "#" in parmTemplate.name:
+                pattern = re.compile(re.escape(parmTemplate.name).replace(r"\#", r"\d+") + "$")
+                self.multiparmTemplates.append((pattern, parmTemplate))
+            else:
+                self.parmTemplates[parmTemplate.name] = parmTemplate
+            if isinstance(parmTemplate, FolderParmTemplate):
+                self.index(parmTemplate.parmTemplates)
+
+    def find(self, name) -> ParmTemplate:
+        parmTemplate = self.parmTemplates.get(name)
+        if parmTemplate is None:
+            for pattern, multiparmTemplate in self.multiparmTemplates:
+                if pattern.match(name):
+                    return multiparmTemplate
+        return parmTemplate
+
+    def validate(self, form, files=None) -> dict:
+        # Returns {parm: value} ready for a single node.setParms call, file
+        # parms map to their uploaded paths. Raises ValidationError listing
+        # every bad parm.
+        parms = {}
+        errors = {}
+        for name, value in form.items():
+            parmTemplate = self.find(name)
+            if parmTemplate is None:
+                errors[name] = "Unknown parameter"
+                continue
+            try:
+                parms[name] = coerce(parmTemplate, value)
+            except ValueError as e:
+                errors[name] = str(e)
+        for name, file in (files or {}).items():
+            parmTemplate = self.find(name)
+            if parmTemplate is None:
+                errors[name] = "Unknown parameter"
+            elif parmTemplate.type != "String":
+                errors[name] = "{} parameters can not take a file".format(parmTemplate.type)
+            else:
+                parms[name] = file
+        if errors:
+            raise ValidationError(errors)
+        return parms
+
+
+def coerce(parmTemplate: ParmTemplate, value):
+    # Form values are JSON: a list with one entry per component, or a bare
+    # string for single string parms
+    try:
+        values = json.loads(value)
+    except ValueError:
+        raise ValueError("Value is not valid JSON")
+    if not isinstance(values, list):
+        values = [values]
+    if len(values) != parmTemplate.numComponents:
+        raise ValueError("Expected {} values, got {}".format(parmTemplate.numComponents, len(values)))
+    coerceValue = COERCERS.get(parmTemplate.type)
+    if coerceValue is None:
+        raise ValueError("{} parameters can not be set".format(parmTemplate.type))
+    values = [coerceValue(parmTemplate, component) for component in values]
+    return tuple(values) if len(values) > 1 else values[0]
+
+
+def coerceInt(parmTemplate, value) -> int:
+    if isinstance(value, str) and value in parmTemplate.menuItems:
+        return list(parmTemplate.menuItems).index(value)
+    value = toInt(value)
+    if parmTemplate.menuItems and not 0 <= value < len(parmTemplate.menuItems):
+        raise ValueError("{} is not a menu entry".format(value))
+    checkRange(parmTemplate, value)
+    return value
+
+
+def coerceFloat(parmTemplate, value) -> float:
+    if isinstance(value, bool):
+        raise ValueError("Expected a number, got {}".format(json.dumps(value)))
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError("Expected a number, got {}".format(json.dumps(value)))
+    checkRange(parmTemplate, value)
+    return value
+
+
+def coerceString(parmTemplate, value) -> str:
+    if isinstance(value, (list, dict)) or value is None:
+        raise ValueError("Expected a string, got {}".format(json.dumps(value)))
+    if isinstance(value, bool):
+        return json.dumps(value)
+    return str(value)
+
+
+def coerceToggle(parmTemplate, value) -> int:
+    if value in (True, False, 0, 1):
+        return int(value)
+    raise ValueError("Expected true or false, got {}".format(json.dumps(value)))
+
+
+def coerceMenu(parmTemplate, value) -> int:
+    # Tokens are accepted and set by index
+    if isinstance(value, str) and value in parmTemplate.menuItems:
+        return list(parmTemplate.menuItems).index(value)
+    value = toInt(value)
+    if not 0 <= value < len(parmTemplate.menuItems):
+        raise ValueError("{} is not a menu entry".format(value))
+    return value
+
+
+def coerceFolder(parmTemplate, value) -> int:
+    # Only multiparm folders hold a value, the number of instances
+    if parmTemplate.folderType not in MULTIPARM_FOLDER_TYPES:
+        raise ValueError("Folder parameters can not be set")
+    value = toInt(value)
+    if value < 0:
+        raise ValueError("Instance count must not be negative")
+    return value
+
+
+def toInt(value) -> int:
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            pass
+    raise ValueError("Expected an integer, got {}".format(json.dumps(value)))
+
+
+def checkRange(parmTemplate, value):
+    if parmTemplate.minIsStrict and parmTemplate.minValue is not None and value < float(parmTemplate.minValue):
+        raise ValueError("{} is below the minimum of {}".format(value, parmTemplate.minValue))
+    if parmTemplate.maxIsStrict and parmTemplate.maxValue is not None and value > float(parmTemplate.maxValue):
+        raise ValueError("{} is above the maximum of {}".format(value, parmTemplate.maxValue))
+
+
+COERCERS = {
+    "Int": coerceInt,
+    "Float": coerceFloat,
+    "String": coerceString,
+    "Toggle": coerceToggle,
+    "Menu": coerceMenu,
+    "Folder": coerceFolder
+}
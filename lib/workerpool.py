@@ -0,0 +1,210 @@
+import os
+import sys
+import json
+import time
+import threading
+import traceback
+import subprocess
+
+
+class WorkerError(Exception):
+    pass
+
+
+class Worker:
+    # One hython subprocess with its own hou session, driven over a
+    # line-delimited JSON protocol on stdin/stdout.
+
+    def __init__(self, command, cwd):
+        self.process = subprocess.Popen(command, cwd=cwd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        universal_newlines=True, bufsize=1)
+        # the scene (e.g. a hip file) this worker has loaded
+        self.affinity = None
+
+    def waitReady(self):
+        reply = self.receive()
+        if not reply.get("ready"):
+            raise WorkerError("worker failed to start")
+
+    def receive(self) -> dict:
+        line = self.process.stdout.readline()
+        if not line:
+            raise WorkerError("worker exited with code {}".format(self.process.poll()))
+        return json.loads(line)
+
+    def call(self, job: dict, timeout=None) -> dict:
+        self.process.stdin.write(json.dumps(job) + "\n")
+        self.process.stdin.flush()
+        if timeout is None:
+            return self.receive()
+        # a hung worker is killed, which ends the read
+        expired = threading.Event()
+
+        def expire():
+            expired.set()
+            self.process.kill()
+        watchdog = threading.Timer(timeout, expire)
+        watchdog.daemon = True
+        watchdog.start()
+        try:
+            return self.receive()
+        except WorkerError:
+            if expired.is_set():
+                raise WorkerError("worker timed out after {} seconds".format(timeout))
+            raise
+        finally:
+            watchdog.cancel()
+
+    def stop(self):
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+        self.process.stdout.close()
+
+
+class WorkerPool:
+    # Jobs with an affinity key go to an idle worker that ran a job with the
+    # same key last, so a scene it has loaded can be reused. A worker that
+    # takes longer than timeout seconds for a job is killed and replaced.
+
+    def __init__(self, size, command=None, cwd=".", timeout=None):
+        self.size = size
+        self.command = command or [sys.executable, "-m", "lib.workerpool"]
+        self.cwd = os.path.abspath(cwd)
+        self.timeout = timeout
+        self.idle = []
+        self.busy = 0
+        self.affinityHits = 0
+        self.affinityMisses = 0
+        self.respawning = 0
+        self.closed = False
+        self.lock = threading.Lock()
+        self.available = threading.Condition(self.lock)
+        workers = [Worker(self.command, self.cwd) for i in range(size)]
+        for worker in workers:
+            worker.waitReady()
+            self.idle.append(worker)
+
+    def spawn(self) -> Worker:
+        worker = Worker(self.command, self.cwd)
+        try:
+            worker.waitReady()
+        except Exception:
+            worker.stop()
+            raise
+        return worker
+
+    def take(self, affinity) -> Worker:
+        # Prefer a worker holding the affinity, then one holding nothing, so
+        # loaded scenes are replaced as late as possible
+        with self.available:
+            while not self.idle:
+                self.available.wait()
+            if affinity is not None:
+                worker = next((worker for worker in self.idle if worker.affinity == affinity), None)
+                if worker is not None:
+                    self.affinityHits += 1
+                else:
+                    self.affinityMisses += 1
+                    worker = next((worker for worker in self.idle if worker.affinity is None), self.idle[0])
+            else:
+                worker = next((worker for worker in self.idle if worker.affinity is None), self.idle[0])
+            self.idle.remove(worker)
+            self.busy += 1
+            return worker
+
+    def release(self, worker: Worker):
+        with self.available:
+            self.busy -= 1
+            self.idle.append(worker)
+            self.available.notify()
+
+    def replace(self, worker: Worker):
+        # Drop a crashed worker, its replacement starts off the request thread
+        with self.available:
+            self.busy -= 1
+            self.respawning += 1
+        threading.Thread(target=self.respawn, args=(worker,), name="harpoon-worker-respawn", daemon=True).start()
+
+    def respawn(self, worker: Worker, delay=1.0):
+        worker.stop()
+        while not self.closed:
+            try:
+                replacement = self.spawn()
+            except (OSError, ValueError, WorkerError) as e:
+                print("Restarting hython worker failed: {}".format(e))
+                time.sleep(delay)
+                delay = min(delay * 2, 60.0)
+                continue
+            with self.available:
+                if not self.closed:
+                    self.respawning -= 1
+                    self.idle.append(replacement)
+                    self.available.notify()
+                    return
+            replacement.stop()
+            return
+
+    def submit(self, job: dict, affinity=None) -> dict:
+        worker = self.take(affinity)
+        try:
+            reply = worker.call(job, self.timeout)
+        except Exception as e:
+            self.replace(worker)
+            raise WorkerError("worker crashed: {}".format(e))
+        if worker.process.poll() is not None:
+            # exited after replying, the reply still counts
+            self.replace(worker)
+        else:
+            if affinity is not None:
+                worker.affinity = affinity
+            self.release(worker)
+        if not reply["ok"]:
+            raise WorkerError(reply["error"])
+        return reply["result"]
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "size": self.size,
+                "busy": self.busy,
+                "idle": len(self.idle),
+                "respawning": self.respawning,
+                "affinityHits": self.affinityHits,
+                "affinityMisses": self.affinityMisses
+            }
+
+    def shutdown(self):
+        with self.lock:
+            self.closed = True
+            workers, self.idle = self.idle, []
+        for worker in workers:
+            worker.stop()
+
+
+def serve():
+    # hou, PDG and HDA Python nodes also write to file descriptor 1 directly.
+    # The protocol keeps its own copy of it, fd 1 itself goes to stderr
+    # before hou is loaded.
+    protocol = os.fdopen(os.dup(1), "w", buffering=1)
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+    from lib import api
+    api.installHDALibrary()
+    protocol.write(json.dumps({"ready": True}) + "\n")
+    protocol.flush()
+    for line in sys.stdin:
+        job = json.loads(line)
+        try:
+            reply = {"ok": True, "result": api.runJob(job)}
+        except Exception as e:
+            traceback.print_exc()
+            reply = {"ok": False, "error": repr(e)}
+        protocol.write(json.dumps(reply) + "\n")
+        protocol.flush()
+
+
+if __name__ == '__main__':
+    serve()
@@ -0,0 +1,88 @@
+import os
+import time
+import uuid
+import shutil
+import threading
+
+WORKSPACE_ROOT = "temp/workspaces"
+OWNER_FILE = ".owner"
+
+# Identifies this server process. Workspaces owned by any other token were left
+# behind by a previous run that crashed or was killed, and can be collected.
+OWNER_TOKEN = "{}:{}".format(os.getpid(), uuid.uuid4().hex)
+
+
+class Workspace:
+    # A private directory for one request or job. It is reference counted so
+    # that whoever still streams files out of it can keep it alive.
+
+    def __init__(self, root=WORKSPACE_ROOT):
+        self.id = uuid.uuid4().hex
+        self.path = os.path.abspath(os.path.join(root, self.id))
+        os.makedirs(self.path)
+        with open(os.path.join(self.path, OWNER_FILE), "w") as fp:
+            fp.write(OWNER_TOKEN)
+        self.refs = 1
+        self.lock = threading.Lock()
+
+    def file(self, *names) -> str:
+        path = os.path.join(self.path, *names)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def retain(self):
+        with self.lock:
+            self.refs += 1
+
+    def release(self):
+        with self.lock:
+            self.refs -= 1
+            if self.refs > 0:
+                return
+        self.cleanup()
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def isGarbage(path, maxAge) -> bool:
+    try:
+        age = time.time() - os.path.getmtime(path)
+    except OSError:
+        return False
+    try:
+        with open(os.path.join(path, OWNER_FILE), "r") as fp:
+            owner = fp.read()
+    except OSError:
+        # the owner file may not be written yet
+        return age > 60
+    return owner != OWNER_TOKEN or age > maxAge
+
+
+def collectGarbage(root=WORKSPACE_ROOT, maxAge=24 * 3600) -> int:
+    if not os.path.isdir(root):
+        return 0
+    removed = 0
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if os.path.isdir(path) and isGarbage(path, maxAge):
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def startCollector(roots, interval=3600, maxAge=24 * 3600):
+    def collect():
+        while True:
+            for root in roots:
+                collectGarbage(root, maxAge)
+            time.sleep(interval)
+    thread = threading.Thread(target=collect, name="harpoon-workspace-gc", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,135 @@
+import os
+import zipfile
+
+COMPRESSION_TYPES = {
+    "stored": zipfile.ZIP_STORED,
+    "deflated": zipfile.ZIP_DEFLATED,
+    "bzip2": zipfile.ZIP_BZIP2,
+    "lzma": zipfile.ZIP_LZMA
+}
+
+# Levels zipfile accepts for each compression, stored and lzma take none
+COMPRESSION_LEVELS = {
+    "deflated": range(0, 10),
+    "bzip2": range(1, 10)
+}
+
+# Per file type defaults. EXR files are already compressed, deflating them
+# again costs a lot of CPU for almost no size gain.
+DEFAULT_COMPRESSION = "deflated"
+FILE_TYPE_COMPRESSION = {
+    ".exr": "stored"
+}
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class _Sink:
+    # Unseekable write target for ZipFile. Everything written is kept until
+    # drained, so the archive can be sent while it is being built.
+
+    def __init__(self):
+        self.chunks = []
+        self.offset = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def parseCompression(args):
+    # Read the compression settings of a request from its query string
+    compression = args.get("compression")
+    if compression is not None and compression not in COMPRESSION_TYPES:
+        raise ValueError("Unknown compression: {}".format(compression))
+    level = args.get("level")
+    if level is not None:
+        # without a compression the level applies to the deflated files
+        levels = COMPRESSION_LEVELS.get(compression or DEFAULT_COMPRESSION)
+        if levels is None:
+            raise ValueError("{} compression takes no level".format(compression))
+        level = int(level)
+        if level not in levels:
+            raise ValueError("{} compression level must be between {} and {}".format(
+                compression or DEFAULT_COMPRESSION, levels[0], levels[-1]))
+    return compression, level
+
+
+def compressionFor(path, compression=None):
+    if compression is None:
+        ext = os.path.splitext(path)[1].lower()
+        compression = FILE_TYPE_COMPRESSION.get(ext, DEFAULT_COMPRESSION)
+    return COMPRESSION_TYPES[compression]
+
+
+def streamZip(files, compression=None, level=None, copyTo=None, onComplete=None):
+    # Yield a zip archive of files chunk by chunk. Each file is compressed and
+    # sent as soon as it is reached, files may be a lazy iterable.
+    sink = _Sink()
+    copy = open(copyTo, "wb") if copyTo is not None else None
+    try:
+        with zipfile.ZipFile(sink, "w") as archive:
+            for path in files:
+                archive.compression = compressionFor(path, compression)
+                archive.compresslevel = level
+                forceZip64 = os.path.getsize(path) >= zipfile.ZIP64_LIMIT
+                with open(path, "rb") as src, archive.open(os.path.basename(path), "w", force_zip64=forceZip64) as dst:
+                    while True:
+                        chunk = src.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        dst.write(chunk)
+                        data = sink.drain()
+                        if data:
+                            if copy is not None:
+                                copy.write(data)
+                            yield data
+        data = sink.drain()
+        if copy is not None:
+            copy.write(data)
+            copy.close()
+            copy = None
+        yield data
+        if onComplete is not None:
+            onComplete()
+    finally:
+        if copy is not None:
+            copy.close()
+
+
+def mergeZips(archives, zipPath):
+    # Combine several archives into one, each under its own folder
+    with zipfile.ZipFile(zipPath, "w") as merged:
+        for folder, path in archives:
+            with zipfile.ZipFile(path, "r") as archive:
+                for info in archive.infolist():
+                    if info.is_dir():
+                        continue
+                    target = zipfile.ZipInfo("{}/{}".format(folder, info.filename), info.date_time)
+                    target.compress_type = info.compress_type
+                    target.external_attr = info.external_attr
+                    with archive.open(info, "r") as src, merged.open(target, "w", force_zip64=info.file_size >= zipfile.ZIP64_LIMIT) as dst:
+                        while True:
+                            chunk = src.read(CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            dst.write(chunk)
+    return zipPath
+
+
+def writeZip(files, zipPath, compression=None, level=None):
+    for chunk in streamZip(files, compression, level, copyTo=zipPath):
+        pass
+    return zipPath
@@ -0,0 +1,128 @@
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUBS_DIR = os.path.join(REPO_DIR, "bench", "stubs")
+sys.path.insert(0, REPO_DIR)
+
+
+class ApiTest(unittest.TestCase):
+    # Drives the routes in process against the stub hou module in bench/stubs
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cwd = os.getcwd()
+        cls.root = tempfile.mkdtemp(prefix="harpoon-test-")
+        for directory in ("HDALibrary", "HIPLibrary", "TORLibrary"):
+            os.makedirs(os.path.join(cls.root, directory))
+        hdas = {"t.hda": {"name": "t", "category": "Top", "outputSize": 16,
+                          "parms": [{"name": "size", "type": "Int", "default": [5]},
+                                    {"name": "heightfield", "type": "String", "default": [""]}]},
+                "slow.hda": {"name": "slow", "category": "Top", "cookDelay": 1.0, "outputSize": 16, "parms": []}}
+        for name, definition in hdas.items():
+            with open(os.path.join(cls.root, "HDALibrary", name), "w") as fp:
+                json.dump(definition, fp)
+        with open(os.path.join(cls.root, "TORLibrary", "land.tor"), "w") as fp:
+            fp.write("test")
+        binDir = os.path.join(cls.root, "bin")
+        os.makedirs(binDir)
+        gaea = os.path.join(binDir, "gaea.build.exe")
+        with open(gaea, "w") as fp:
+            fp.write('#!/bin/sh\nexec "{}" "{}" "$@"\n'.format(sys.executable, os.path.join(STUBS_DIR, "gaea.py")))
+        os.chmod(gaea, 0o755)
+        cls.path = os.environ["PATH"]
+        os.environ["PATH"] = binDir + os.pathsep + cls.path
+        # the api works on paths relative to the library root
+        os.chdir(cls.root)
+        sys.path.insert(0, STUBS_DIR)
+        import harpoon
+        from lib import api
+        cls.api = api
+        cls.client = harpoon.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        os.chdir(cls.cwd)
+        os.environ["PATH"] = cls.path
+        shutil.rmtree(cls.root, ignore_errors=True)
+
+    def waitFor(self, condition, timeout=10.0):
+        deadline = time.time() + timeout
+        while not condition():
+            self.assertLess(time.time(), deadline, "timed out")
+            time.sleep(0.05)
+
+    def test_job_and_request_share_a_cook_with_one_slot(self):
+        # A job joining the flight of a request still waiting for the only
+        # slot must not take that slot itself
+        slots = self.api.scheduler.slots
+        self.api.scheduler.slots = 1
+        try:
+            responses = {}
+
+            def post(name, url, data):
+                response = self.client.post(url, data=data)
+                responses[name] = response.status_code
+                response.close()
+            form = {"variants": json.dumps([{"size": [2]}, {"size": [3]}])}
+            blocker = threading.Thread(target=post, args=("blocker", "/api/hdaprocessor/slow.hda", {}), daemon=True)
+            blocker.start()
+            self.waitFor(lambda: self.api.scheduler.stats()["running"] == 1)
+            request = threading.Thread(target=post, args=("request", "/api/hdaprocessor/t.hda/batch", form), daemon=True)
+            request.start()
+            self.waitFor(lambda: self.api.cookFlights.stats()["inFlight"] == 1)
+            # ahead of the request in the queue
+            response = self.client.post("/api/jobs/hdabatch/t.hda", data=form,
+                                        headers={"X-Harpoon-Priority": "interactive"})
+            self.assertEqual(response.status_code, 202)
+            job = response.json["id"]
+            blocker.join(10)
+            request.join(10)
+            self.assertFalse(request.is_alive(), "request never finished")
+            self.assertEqual(responses, {"blocker": 200, "request": 200})
+            self.waitFor(lambda: self.client.get("/api/jobs/" + job).json["status"] == "done")
+            self.assertEqual(self.api.scheduler.stats()["running"], 0)
+        finally:
+            self.api.scheduler.slots = slots
+
+    @unittest.skipUnless(os.name == "posix", "the stub Gaea CLI is launched through a shell script")
+    def test_compression_level_out_of_range(self):
+        for query in ("compression=bzip2&level=0", "compression=deflated&level=10", "compression=lzma&level=5",
+                      "compression=stored&level=1", "level=x"):
+            response = self.client.post("/api/torprocessor/land.tor?" + query, data={})
+            self.assertEqual(response.status_code, 400, query)
+            self.assertIn("error", response.json)
+        response = self.client.post("/api/torprocessor/land.tor?compression=bzip2&level=1", data={})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[:2], b"PK")
+
+    @unittest.skipUnless(os.name == "posix", "the stub Gaea CLI is launched through a shell script")
+    def test_tor_bare_scalars(self):
+        # Gaea gets the values the validator coerced, not the raw form
+        with mock.patch.object(self.api.gaeaRunner, "run", wraps=self.api.gaeaRunner.run) as run:
+            response = self.client.post("/api/torprocessor/land.tor", data={"seed": "3", "erosion": "true"})
+        self.assertEqual(response.status_code, 200)
+        response.close()
+        args = run.call_args[0][0]
+        self.assertIn("seed:3", args)
+        self.assertIn("erosion:True", args)
+
+    def test_non_ascii_upload_keeps_extension(self):
+        with mock.patch.object(self.api, "runHDA", wraps=self.api.runHDA) as runHDA:
+            response = self.client.post("/api/hdaprocessor/t.hda",
+                                        data={"heightfield": (io.BytesIO(b"test"), "\u5730\u5f62.png")})
+        self.assertEqual(response.status_code, 200)
+        response.close()
+        self.assertEqual(os.path.basename(runHDA.call_args[0][1]["heightfield"]), "upload.png")
+
+
+if __name__ == "__main__":
+    unittest.main()
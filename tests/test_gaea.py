@@ -0,0 +1,95 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GAEA_STUB = os.path.join(REPO_DIR, "bench", "stubs", "gaea.py")
+sys.path.insert(0, REPO_DIR)
+
+from lib.gaea import GaeaRunner, GaeaError, GaeaTimeout, GaeaCancelled
+
+
+@unittest.skipUnless(os.name == "posix", "the stub Gaea CLI is launched through a shell script")
+class GaeaRunnerTest(unittest.TestCase):
+    # Runs the stub Gaea CLI in bench/stubs
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="harpoon-test-")
+        self.project = os.path.join(self.root, "land.tor")
+        with open(self.project, "w") as fp:
+            fp.write("test")
+        self.runner = GaeaRunner(self.launcher("gaea.build.exe", True))
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def launcher(self, name, replace) -> str:
+        # Without exec the shell stays around as the parent of the build,
+        # like a launcher that starts Gaea as a child process
+        path = os.path.join(self.root, name)
+        with open(path, "w") as fp:
+            fp.write('#!/bin/sh\n{}"{}" "{}" "$@"\n'.format("exec " if replace else "", sys.executable, GAEA_STUB))
+        os.chmod(path, 0o755)
+        return path
+
+    def build(self, runner=None, **kwargs):
+        output = os.path.join(self.root, "heightmap.exr")
+        return (runner or self.runner).run([self.project, "heightmap:" + output], **kwargs), output
+
+    def test_build(self):
+        with mock.patch.dict(os.environ, {"GAEA_STUB_DELAY": "0", "GAEA_STUB_OUTPUT_SIZE": "64"}):
+            result, output = self.build()
+        self.assertEqual(result.returncode, 0)
+        self.assertIn("built", result.stdout)
+        self.assertEqual(os.path.getsize(output), 64)
+        self.assertEqual(self.runner.stats()["completed"], 1)
+
+    def test_exit_code(self):
+        with mock.patch.dict(os.environ, {"GAEA_STUB_DELAY": "0", "GAEA_STUB_EXIT": "3"}):
+            with self.assertRaises(GaeaError) as raised:
+                self.build()
+        self.assertNotIsInstance(raised.exception, (GaeaTimeout, GaeaCancelled))
+        self.assertEqual(raised.exception.result.returncode, 3)
+        self.assertEqual(self.runner.stats()["failed"], 1)
+
+    def test_timeout(self):
+        with mock.patch.dict(os.environ, {"GAEA_STUB_DELAY": "5"}):
+            start = time.time()
+            with self.assertRaises(GaeaTimeout):
+                self.build(timeout=0.5)
+        self.assertLess(time.time() - start, 2.0)
+        self.assertEqual(self.runner.stats()["timeouts"], 1)
+
+    def test_timeout_kills_child_processes(self):
+        runner = GaeaRunner(self.launcher("launcher.sh", False))
+        with mock.patch.dict(os.environ, {"GAEA_STUB_DELAY": "5"}):
+            start = time.time()
+            with self.assertRaises(GaeaTimeout):
+                self.build(runner, timeout=0.5)
+        self.assertLess(time.time() - start, 2.0)
+
+    def test_cancel(self):
+        cancelEvent = threading.Event()
+        threading.Timer(0.3, cancelEvent.set).start()
+        with mock.patch.dict(os.environ, {"GAEA_STUB_DELAY": "5"}):
+            start = time.time()
+            with self.assertRaises(GaeaCancelled):
+                self.build(cancelEvent=cancelEvent)
+        self.assertLess(time.time() - start, 2.0)
+        self.assertEqual(self.runner.stats()["cancelled"], 1)
+
+    def test_cancelled_before_start(self):
+        cancelEvent = threading.Event()
+        cancelEvent.set()
+        with self.assertRaises(GaeaCancelled):
+            self.build(cancelEvent=cancelEvent)
+        self.assertFalse(os.path.exists(os.path.join(self.root, "heightmap.exr")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from lib.singleflight import SingleFlight
+
+
+class Cancelled(Exception):
+    pass
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="harpoon-test-")
+        self.flights = SingleFlight(unshared=(Cancelled,))
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def path(self, name) -> str:
+        return os.path.join(self.root, name)
+
+    def leaderCook(self, path, error=None):
+        # Holds the flight open until release is set
+        def cook():
+            self.started.set()
+            self.release.wait(10)
+            if error is not None:
+                raise error
+            with open(path, "w") as fp:
+                fp.write("leader")
+        return cook
+
+    def startLeader(self, cook) -> dict:
+        result = {}
+
+        def lead():
+            try:
+                result["cooked"] = self.flights.run("key", [self.path("leader")], cook)
+            except Exception as e:
+                result["error"] = e
+        thread = threading.Thread(target=lead)
+        thread.start()
+        self.assertTrue(self.started.wait(10))
+        result["thread"] = thread
+        return result
+
+    def follow(self, path, cook=None) -> dict:
+        result = {}
+
+        def follow():
+            try:
+                result["cooked"] = self.flights.run("key", [path], cook or (lambda: self.fail("follower cooked")))
+            except Exception as e:
+                result["error"] = e
+        result["thread"] = threading.Thread(target=follow)
+        result["thread"].start()
+        return result
+
+    def waitForFollowers(self, count):
+        while self.flights.stats()["waiting"] < count:
+            time.sleep(0.01)
+
+    def test_follower_gets_leader_output(self):
+        leader = self.startLeader(self.leaderCook(self.path("leader")))
+        follower = self.follow(self.path("follower"))
+        self.waitForFollowers(1)
+        self.release.set()
+        leader["thread"].join(10)
+        follower["thread"].join(10)
+        self.assertEqual((leader["cooked"], follower["cooked"]), (True, False))
+        with open(self.path("follower")) as fp:
+            self.assertEqual(fp.read(), "leader")
+        self.assertEqual(self.flights.stats()["saved"], 1)
+
+    def test_cook_error_is_shared(self):
+        leader = self.startLeader(self.leaderCook(self.path("leader"), ValueError("broken")))
+        follower = self.follow(self.path("follower"))
+        self.waitForFollowers(1)
+        self.release.set()
+        leader["thread"].join(10)
+        follower["thread"].join(10)
+        self.assertIsInstance(follower["error"], ValueError)
+
+    def test_failed_copy_only_fails_its_follower(self):
+        leader = self.startLeader(self.leaderCook(self.path("leader")))
+        gone = self.follow(os.path.join(self.root, "gone", "follower"))
+        follower = self.follow(self.path("follower"))
+        self.waitForFollowers(2)
+        self.release.set()
+        leader["thread"].join(10)
+        gone["thread"].join(10)
+        follower["thread"].join(10)
+        self.assertTrue(leader["cooked"])
+        self.assertIsInstance(gone["error"], OSError)
+        self.assertFalse(follower["cooked"])
+        self.assertEqual(self.flights.stats()["saved"], 1)
+
+    def test_cancelled_leader_hands_over(self):
+        def cook():
+            with open(self.path("follower"), "w") as fp:
+                fp.write("follower")
+        leader = self.startLeader(self.leaderCook(self.path("leader"), Cancelled()))
+        follower = self.follow(self.path("follower"), cook)
+        self.waitForFollowers(1)
+        self.release.set()
+        leader["thread"].join(10)
+        follower["thread"].join(10)
+        self.assertIsInstance(leader["error"], Cancelled)
+        self.assertNotIn("error", follower)
+        self.assertTrue(follower["cooked"])
+        self.assertEqual(self.flights.stats()["cooks"], 2)
+
+    def test_output_count_mismatch(self):
+        leader = self.startLeader(self.leaderCook(self.path("leader")))
+        with self.assertRaises(ValueError):
+            self.flights.run("key", [self.path("a"), self.path("b")], lambda: None)
+        self.release.set()
+        leader["thread"].join(10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUBS_DIR = os.path.join(REPO_DIR, "bench", "stubs")
+sys.path.insert(0, REPO_DIR)
+
+from lib.workerpool import WorkerPool, WorkerError
+
+
+class WorkerPoolTest(unittest.TestCase):
+    # Runs real worker processes against the stub hou module in bench/stubs
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pythonPath = os.environ.get("PYTHONPATH")
+        os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, [STUBS_DIR, REPO_DIR, cls.pythonPath]))
+        cls.root = tempfile.mkdtemp(prefix="harpoon-test-")
+        for directory in ("HDALibrary", "HIPLibrary", "TORLibrary"):
+            os.makedirs(os.path.join(cls.root, directory))
+        cls.hdaPath = os.path.join(cls.root, "HDALibrary", "terrain.hda")
+        with open(cls.hdaPath, "w") as fp:
+            json.dump({"name": "terrain", "category": "Top", "outputSize": 16,
+                       "parms": [{"name": "size", "type": "Int", "default": [5]}]}, fp)
+        # writes to fd 1 while cooking, and never finishes
+        cls.noisyPath = os.path.join(cls.root, "HDALibrary", "noisy.hda")
+        with open(cls.noisyPath, "w") as fp:
+            json.dump({"name": "noisy", "category": "Top", "outputSize": 16, "cookOutput": "not json\n", "parms": []}, fp)
+        cls.hungPath = os.path.join(cls.root, "HDALibrary", "hung.hda")
+        with open(cls.hungPath, "w") as fp:
+            json.dump({"name": "hung", "category": "Top", "cookDelay": 60, "parms": []}, fp)
+        cls.hipPaths = []
+        for hip in ("a.hip", "b.hip"):
+            cls.hipPaths.append(os.path.join(cls.root, "HIPLibrary", hip))
+            with open(cls.hipPaths[-1], "w") as fp:
+                fp.write("test")
+        cls.pool = WorkerPool(2, cwd=cls.root)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.shutdown()
+        shutil.rmtree(cls.root, ignore_errors=True)
+        if cls.pythonPath is None:
+            os.environ.pop("PYTHONPATH", None)
+        else:
+            os.environ["PYTHONPATH"] = cls.pythonPath
+
+    def waitForWorkers(self, timeout=30.0):
+        deadline = time.time() + timeout
+        while self.pool.stats()["idle"] < self.pool.size:
+            self.assertLess(time.time(), deadline, "workers did not come back")
+            time.sleep(0.1)
+
+    def hipJob(self, hipPath) -> dict:
+        return {"type": "hip", "hipPath": hipPath, "force": False}
+
+    def test_dispatch(self):
+        output = os.path.join(self.root, "dispatch.zip")
+        result = self.pool.submit({"type": "hda", "hdaPath": self.hdaPath, "parms": {"size": 3}, "output": output})
+        self.assertEqual(result, output)
+        with zipfile.ZipFile(output) as zf:
+            self.assertEqual(zf.namelist(), ["output.bin"])
+
+    def test_native_stdout(self):
+        output = os.path.join(self.root, "noisy.zip")
+        self.assertEqual(self.pool.submit({"type": "hda", "hdaPath": self.noisyPath, "parms": {}, "output": output}),
+                         output)
+        self.assertEqual(self.pool.submit(self.hipJob(self.hipPaths[0])), self.hipPaths[0])
+
+    def test_hung_worker_timeout(self):
+        pool = WorkerPool(1, cwd=self.root, timeout=1.0)
+        try:
+            start = time.time()
+            with self.assertRaises(WorkerError) as raised:
+                pool.submit({"type": "hda", "hdaPath": self.hungPath, "parms": {},
+                             "output": os.path.join(self.root, "hung.zip")})
+            self.assertIn("timed out", str(raised.exception))
+            self.assertLess(time.time() - start, 5.0)
+            self.assertEqual(pool.submit(self.hipJob(self.hipPaths[0])), self.hipPaths[0])
+        finally:
+            pool.shutdown()
+
+    def test_job_error_keeps_worker(self):
+        with self.assertRaises(WorkerError) as raised:
+            self.pool.submit({"type": "unknown"})
+        self.assertIn("Unknown job type", str(raised.exception))
+        self.assertEqual(self.pool.stats()["idle"], self.pool.size)
+
+    def test_affinity(self):
+        self.pool.submit(self.hipJob(self.hipPaths[0]), affinity=self.hipPaths[0])
+        self.pool.submit(self.hipJob(self.hipPaths[1]), affinity=self.hipPaths[1])
+        hits = self.pool.stats()["affinityHits"]
+        for hipPath in self.hipPaths:
+            self.pool.submit(self.hipJob(hipPath), affinity=hipPath)
+        self.assertEqual(self.pool.stats()["affinityHits"], hits + 2)
+        self.assertEqual(sorted(worker.affinity for worker in self.pool.idle), sorted(self.hipPaths))
+
+    def test_crash_respawn(self):
+        self.waitForWorkers()
+        for worker in list(self.pool.idle):
+            worker.process.kill()
+            worker.process.wait()
+        start = time.time()
+        with self.assertRaises(WorkerError):
+            self.pool.submit(self.hipJob(self.hipPaths[0]))
+        # the replacement starts in the background, not on the failing request
+        self.assertLess(time.time() - start, 1.0)
+        with self.assertRaises(WorkerError):
+            self.pool.submit(self.hipJob(self.hipPaths[0]))
+        self.waitForWorkers()
+        self.assertEqual(self.pool.submit(self.hipJob(self.hipPaths[0])), self.hipPaths[0])
+        stats = self.pool.stats()
+        self.assertEqual((stats["busy"], stats["respawning"]), (0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()